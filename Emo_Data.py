@@ -15,7 +15,13 @@ Last Modified                   08/16/2021
 
 from datetime import datetime
 import os
-from statsmodels.stats.anova import AnovaRM
+import io
+import re
+import json
+import time
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from os import path
 from os import listdir
 from os.path import isfile, join
@@ -24,6 +30,23 @@ import pandas as pd
 import glob
 import shutil
 import argparse
+import Emo_Score
+import Emo_Manifest
+import Emo_Stats
+
+TRIAL_COLUMNS = {'TrialNum': 'trial', 'Image': 'image', 'TrialType': 'type',
+                 'Keypress': 'key', 'RT': 'rt', 'Onset': 'onset', 'Offset': 'offset'}
+RPT_HEADERS = ['ID', 'Set', 'digitime', 'File_Create', 'LDI_Neg_Low_Sim', 'LDI_Neg_High_Sim',
+               'LDI_Neut_High_Sim', 'LDI_Pos_Low_Sim', 'LDI_Neg_Collapsed', 'LDI_Neut_Collapsed',
+               'LDI_Pos_Collapsed', 'RecMem_Neg', 'RecMem_Neu', 'RecMem_Pos', 'Log']
+SCORE_LINE = re.compile(r'^((?:LDI|RecMem)-[^:\n]+): *(-?[0-9.]+)', re.M)
+SCORE_FIELDS = dict(zip(Emo_Score.SCORE_LABELS, Emo_Score.SCORE_COLUMNS))
+CACHE_NAME = 'log_cache.sqlite'
+CACHE_VERSION = 2       #Bump when parse_log_text changes what it returns
+SUBJECTS_NAME = 'subjects.arrow'
+RESULTS_NAME = 'results.json'
+DEPVARS = ['LDI_Neg_Low_Sim', 'LDI_Neg_High_Sim', 'LDI_Neut_High_Sim', 'LDI_Pos_Low_Sim', 'LDI_Neg_Collapsed',
+           'LDI_Neut_Collapsed', 'LDI_Pos_Collapsed', 'RecMem_Neg', 'RecMem_Neu', 'RecMem_Pos']
 
 def main():
     error_log = "Data Parsed, Error Occured During, Record, Notes" + '\n'
@@ -34,151 +57,520 @@ def main():
         error_level = "Get Parameters, Add arguments to parser,"
         parser.add_argument('-s', required=True, help="Log Files Folder")
         parser.add_argument('-d', required=True, help="Output folder for Results")
+        parser.add_argument('-j', '--jobs', type=int, default=1, help="Number of processes parsing logs")
+        parser.add_argument('--rescore', action='store_true', help="Recompute the scores from the test "
+                            "trials of each log instead of reading the score lines")
+        parser.add_argument('--no-cache', action='store_true', help="Re-parse every log instead of using the "
+                            "parse cache in the output folder")
+        parser.add_argument('--resamples', type=int, default=0, help="Number of permutation and bootstrap "
+                            "resamples of the inst effects (written to resampling.csv), 0 to skip")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the resampling")
+        parser.add_argument('--watch', action='store_true', help="Keep watching the log folder and update the "
+                            "per-set summary as sessions finish (Ctrl-C to stop)")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds between polls in watch mode")
         error_level = "Get Parameters, Run Args Parser,"
         args = parser.parse_args()
         error_level = "Get Parameters, Declare Arg Parser,"
         source = args.s
-        rfound = 0
         dest = args.d
+        records = []
+        trial_logs = []
+        files = []
+        error_level = "Data Output, create output folder,"
+        if not path.exists(dest):
+            os.makedirs(dest)
+        cache = None if args.no_cache else join(dest, CACHE_NAME)
+        if args.watch:
+            error_level = "Watch, monitor log folder,"
+            watch_logs(source, args.interval, args.jobs, cache)
+            return
+        ingest_start = time.perf_counter()
         if path.exists(source):
-            error_level = "Pre-cleaning,remove old folders,"
-            rpt_dict = get_rpt_dictionary()
-            for F in glob.glob(source + "/*.txt"):
-                error_level = "File iteration, Save any previous file data,"
-                if rfound > 0:
-                    error_level = "Saving data, add found items to dictionary,"
-                    df_rpt_row = pd.DataFrame(rpt_dict, index=[0])
-                    if rfound == 1:
-                            df_rpt = df_rpt_row
-                    elif rfound > 1:
-                        df_rpt = df_rpt.append(df_rpt_row)
-                    rpt_dict = get_rpt_dictionary()
-                error_level = "File Parsing,Get File_name,"
-                digitime = os.path.getmtime(F)
-                rpt_dict['dititime'] = digitime
-                File_Create = datetime.fromtimestamp(os.path.getmtime(F))
-                rpt_dict['File_Create'] = File_Create
-                fname = get_file_name(F)
-                error_level = "File Parsing,Get File_name,"
-                IDParts = fname.split('_')
-                ID = IDParts[0]
-                rpt_dict['ID'] = ID
-                Set = IDParts[1]
-                rpt_dict['Set'] = Set
-                with open(F, 'r') as mfile:
-                    log_data = mfile.readlines()
-                for l in log_data:
-                    l = l.strip()
-                    if "LDI-Negative Low Sim" in l:
-                        ivar = l.split(':')[1]
-                        ivar = ivar.strip()
-                        LDI_Neg_Low_Sim = float(ivar)
-                        rpt_dict['LDI_Neg_Low_Sim'] = LDI_Neg_Low_Sim
-                        rfound += 1
-                    elif "LDI-Negative High Sim" in l:
-                        ivar = l.split(':')[1]
-                        ivar = ivar.strip()
-                        LDI_Neg_High_Sim = float(ivar)
-                        rpt_dict['LDI_Neg_High_Sim'] = LDI_Neg_High_Sim
-                    elif "LDI-Neutral Low Sim" in l:
-                        ivar = l.split(':')[1]
-                        ivar = ivar.strip()
-                        LDI_Neut_Low_Sim = float(ivar)
-                    elif "LDI-Neutral High Sim" in l:
-                        ivar = l.split(':')[1]
-                        ivar = ivar.strip()
-                        LDI_Neut_High_Sim = float(ivar)
-                        rpt_dict['LDI_Neut_High_Sim'] = LDI_Neut_High_Sim
-                    elif "LDI-Positive Low Sim" in l:
-                        ivar = l.split(':')[1]
-                        ivar = ivar.strip()
-                        LDI_Pos_Low_Sim = float(ivar)
-                    elif "LDI-Positive High Sim" in l:
-                        ivar = l.split(':')[1]
-                        ivar = ivar.strip()
-                        LDI_Pos_High_Sim = float(ivar)
-                        rpt_dict['LDI_Pos_Low_Sim'] = LDI_Pos_Low_Sim
-                    elif "LDI-Negative Collapsed" in l:
-                        ivar = l.split(':')[1]
-                        ivar = ivar.strip()
-                        LDI_Neg_Collapsed = float(ivar)
-                        rpt_dict['LDI_Neg_Collapsed'] = LDI_Neg_Collapsed
-                    elif "LDI-Neutral Collapsed" in l:
-                        ivar = l.split(':')[1]
-                        ivar = ivar.strip()
-                        LDI_Neut_Collapsed = float(ivar)
-                        rpt_dict['LDI_Neut_Collapsed'] = LDI_Neut_Collapsed
-                    elif "LDI-Positive Collapsed" in l:
-                        ivar = l.split(':')[1]
-                        ivar = ivar.strip()
-                        LDI_Pos_Collapsed = float(ivar)
-                        rpt_dict['LDI_Pos_Collapsed'] = LDI_Pos_Collapsed
-                    elif "RecMem-Neg" in l:
-                        ivar = l.split(':')[1]
-                        ivar = ivar.strip()
-                        RecMem_Neg = float(ivar)
-                        rpt_dict['RecMem_Neg'] = RecMem_Neg
-                    elif "RecMem-Neu" in l:
-                        ivar = l.split(':')[1]
-                        ivar = ivar.strip()
-                        RecMem_Neu = float(ivar)
-                        rpt_dict['RecMem_Neu'] = RecMem_Neu
-                    elif "RecMem-Pos" in l:
-                        ivar = l.split(':')[1]
-                        ivar = ivar.strip()
-                        RecMem_Pos = float(ivar)
-                        rpt_dict['RecMem_Pos'] = RecMem_Pos
-                error_level = "Pre-cleaning,remove old folders,"
-        error_level = "Data Processing, append last row,"
-        if rfound > 1:
-            df_rpt_row = pd.DataFrame(rpt_dict, index=[0])
-            df_rpt = df_rpt.append(df_rpt_row)
-        error_level = "Data Processing, order by ID and date,"
-        df_rpt_r = df_rpt.sort_values(by=['ID', 'File_Create', 'Set'])
-        error_level = "Data Processing, Create count of ,"
-        df_rpt_r['inst'] = df_rpt_r.groupby(['ID']).cumcount()+1
-        error_level = "Data Processing, order by ID and date,"
-        df_rpt_r = df_rpt_r.loc[(df_rpt_r['inst'] < 3)]
-        #df_rpt_m = pd.merge(df_rpt.loc[df_rpt['inst']==1], df_rpt.loc[df_rpt['inst']==2], on=['ID'])
-        error_level = "Data Processing, order by ID and date,"
-        depvars = "LDI_Neg_Low_Sim,LDI_Neg_High_Sim,LDI_Neut_High_Sim,LDI_Pos_Low_Sim,LDI_Neg_Collapsed," \
-                      "LDI_Neut_Collapsed,LDI_Pos_Collapsed,RecMem_Neg,RecMem_Neu,RecMem_Pos"
-        depvars = depvars.split(',')
-        print("Analysis By Order\n\n")
-        for items in depvars:
-            print("Evaluating: ", items)
-            print(AnovaRM(data=df_rpt_r, depvar=items, subject='ID', within=['inst']).fit())
-        error_level = "Data Processing, order by ID and Set,"
-        df_rpt_s = df_rpt.sort_values(by=['ID', 'Set'])
-        error_level = "Data Processing, Create count of ,"
-        df_rpt_s['inst'] = df_rpt_s.groupby(['ID']).cumcount()+1
+            error_level = "File iteration, ingest logs,"
+            files = sorted(glob.glob(source + "/*.txt"))
+            records, trial_logs = ingest_logs(files, args.jobs, cache, source)
+        ingest_time = time.perf_counter() - ingest_start
+        error_level = "Data Processing, build report table,"
+        df_rpt = pd.DataFrame.from_records(records, columns=RPT_HEADERS)
+        error_level = "Data Processing, build trial table,"
+        df_trials = get_trial_table(trial_logs)
+        error_level = "Data Output, write trial table,"
+        df_trials.to_parquet(join(dest, 'trials.parquet'), index=False)
+        if args.rescore:
+            error_level = "Data Processing, rescore logs from trial table,"
+            df_scores = Emo_Score.score_table(df_trials.loc[df_trials['phase'] == 'Test'], ['log'], decimals=2)
+            score_cols = [col for col in Emo_Score.SCORE_COLUMNS if col in df_rpt]
+            df_rpt[score_cols] = df_scores.reindex(df_rpt['Log'])[score_cols].fillna(0).to_numpy()
         error_level = "Data Processing, order by ID and date,"
-        df_rpt_s = df_rpt_s.loc[(df_rpt_s['inst'] < 3)]
-        #df_rpt_m = pd.merge(df_rpt.loc[df_rpt['inst']==1], df_rpt.loc[df_rpt['inst']==2], on=['ID'])
-        error_level = "Data Processing, order by ID and date,"
-        depvars = "LDI_Neg_Low_Sim,LDI_Neg_High_Sim,LDI_Neut_High_Sim,LDI_Pos_Low_Sim,LDI_Neg_Collapsed," \
-                      "LDI_Neut_Collapsed,LDI_Pos_Collapsed,RecMem_Neg,RecMem_Neu,RecMem_Pos"
-        depvars = depvars.split(',')
-        print("\n\n\nAnalysis By Set")
-        for items in depvars:
-            print("Evaluating: ", items)
-            print(AnovaRM(data=df_rpt_s, depvar=items, subject='ID', within=['inst']).fit())
-        df_diff = df_rpt.groupby(by=['Set']).agg({'LDI_Neg_High_Sim': ['mean','std']})
-        print(df_diff.head)
+        df_rpt_r = get_inst_frame(df_rpt, ['ID', 'File_Create', 'Set'])
+        error_level = "Data Processing, descriptives by set,"
+        df_desc = get_descriptives(df_rpt)
+        print("Descriptives by set\n")
+        print(df_desc.pivot(index='depvar', columns='Set', values=['mean', 'std', 'N'])
+              .reindex(DEPVARS).round(3).to_string())
+        error_level = "Data Output, write subject table and descriptives,"
+        tables = {'subjects': get_subject_table(df_rpt_r), 'descriptives': df_desc}
+        info = {'source': source, 'logs': len(files), 'sessions': len(df_rpt), 'rescored': args.rescore,
+                'resamples': args.resamples, 'seed': args.seed}
+        write_results(dest, tables, info)
+        error_level = "Data Processing, ANOVA by order and by set,"
+        df_complete = get_complete_subjects(df_rpt)
+        info['anova_subjects'] = int(df_complete['ID'].nunique())
+        if len(df_complete):
+            df_anova, df_rpt_r, df_rpt_s = get_anova(df_complete)
+            print("\nRepeated Measures ANOVA (within: inst), %d of %d subjects with two sessions\n"
+                  % (info['anova_subjects'], df_rpt['ID'].nunique()))
+            print(df_anova.to_string(index=False))
+            tables['anova'] = df_anova
+        else:
+            print("\nNo subject with two sessions, ANOVA skipped")
+        if args.resamples > 0 and len(df_complete):
+            error_level = "Data Processing, resampling inst effects,"
+            df_resample = pd.concat([
+                Emo_Stats.resample_rm(df_rpt_r, DEPVARS, 'ID', 'inst', args.resamples, args.seed,
+                                      args.jobs).assign(analysis='order'),
+                Emo_Stats.resample_rm(df_rpt_s, DEPVARS, 'ID', 'inst', args.resamples, args.seed,
+                                      args.jobs).assign(analysis='set')], ignore_index=True)
+            df_resample = df_resample[['analysis'] + Emo_Stats.RESAMPLE_COLUMNS]
+            print("\nPermutation p and bootstrap CIs (%d resamples, seed %d)\n" % (args.resamples, args.seed))
+            print(df_resample[['analysis', 'depvar', 'p', 'p_perm', 'diff', 'diff_low',
+                               'diff_high']].to_string(index=False))
+            tables['resampling'] = df_resample
+        error_level = "Data Output, write results,"
+        write_results(dest, tables, info)
+        print("\nParsed %d files in %.2f s (%.0f files/s)" %
+              (len(files), ingest_time, len(files) / max(ingest_time, 1e-9)))
     except:
         error_log = error_log + error_level +    ',' + str(sys.exc_info()[1]) + '\n'
     print(error_log)
 
 
-def get_rpt_dictionary():
+def get_inst_frame(df_rpt, order):
+    """Numbers the sessions of each ID (inst) in the given sort order and
+    keeps the first two."""
+    df_inst = df_rpt.sort_values(by=order)
+    df_inst['inst'] = df_inst.groupby(['ID']).cumcount()+1
+    return df_inst.loc[(df_inst['inst'] < 3)]
+
+
+def get_complete_subjects(df_rpt):
+    """Returns the sessions of the IDs with at least two, the ones the
+    ANOVAs can use."""
+    return df_rpt.loc[df_rpt.groupby('ID')['ID'].transform('size') > 1]
+
+
+def get_anova(df_rpt):
+    """Runs the repeated measures ANOVAs of DEPVARS on inst, with sessions
+    numbered by date (order) and by set, and returns the tidy results
+    along with the two inst frames."""
+    df_rpt_r = get_inst_frame(df_rpt, ['ID', 'File_Create', 'Set'])
+    df_anova_r = Emo_Stats.anova_rm(df_rpt_r, DEPVARS, subject='ID', within=['inst'])
+    df_rpt_s = get_inst_frame(df_rpt, ['ID', 'Set'])
+    df_anova_s = Emo_Stats.anova_rm(df_rpt_s, DEPVARS, subject='ID', within=['inst'])
+    df_anova = pd.concat([df_anova_r.assign(analysis='order'), df_anova_s.assign(analysis='set')],
+                         ignore_index=True)
+    return df_anova[['analysis'] + Emo_Stats.ANOVA_COLUMNS], df_rpt_r, df_rpt_s
+
+
+def get_subject_table(df_rpt_r):
+    """Returns the per-subject wide table: one row per ID with the set, date,
+    log and DEPVARS of each of its sessions in order (columns suffixed _1,
+    _2). Subjects with a single session have missing _2 values."""
+    values = ['Set', 'File_Create', 'Log'] + DEPVARS
+    df_wide = df_rpt_r.pivot(index='ID', columns='inst', values=values)
+    df_wide = df_wide.reindex(columns=[(col, inst) for inst in [1, 2] for col in values])
+    df_wide.columns = ['%s_%d' % (col, inst) for col, inst in df_wide.columns]
+    for col in df_wide.columns:
+        if col.split('_')[0] in ('Set', 'File', 'Log'):
+            df_wide[col] = df_wide[col].astype('string')
+        else:
+            df_wide[col] = df_wide[col].astype(float)
+    return df_wide.reset_index()
+
+
+def get_descriptives(df_rpt):
+    """Returns the mean, std and N of DEPVARS by set as a tidy frame (Set,
+    depvar, mean, std, N)."""
+    df_long = df_rpt.melt(id_vars=['Set'], value_vars=DEPVARS, var_name='depvar')
+    df_long['depvar'] = pd.Categorical(df_long['depvar'], categories=DEPVARS)
+    df_desc = df_long.groupby(['Set', 'depvar'], observed=True)['value'].agg(['mean', 'std', 'count'])
+    return df_desc.rename(columns={'count': 'N'}).reset_index().astype({'depvar': str})
+
+
+def write_results(dest, tables, info):
+    """Writes the result tables to dest in one pass. The subject table is
+    written once as an uncompressed Feather (Arrow IPC) file, which
+    load_results memory-maps instead of reading, plus a CSV copy; the other
+    tables as CSV. results.json bundles every table but the subject table
+    with the run info, for dashboards. Each file is replaced atomically."""
+    written = {}
+    for name, df in tables.items():
+        if name == 'subjects':
+            fpath = join(dest, SUBJECTS_NAME)
+            df.to_feather(fpath + '.tmp', compression='uncompressed')
+            os.replace(fpath + '.tmp', fpath)
+        fpath = join(dest, name + '.csv')
+        df.to_csv(fpath + '.tmp', index=False)
+        os.replace(fpath + '.tmp', fpath)
+        written[name] = fpath
+    results = dict(info, created=datetime.now().isoformat(timespec='seconds'),
+                   subjects=SUBJECTS_NAME, files=dict((name, path.basename(fpath))
+                                                      for name, fpath in written.items()))
+    for name, df in tables.items():
+        if name != 'subjects':
+            results[name] = json.loads(df.to_json(orient='records'))
+    fpath = join(dest, RESULTS_NAME)
+    with open(fpath + '.tmp', 'w') as f:
+        json.dump(results, f, indent=1)
+    os.replace(fpath + '.tmp', fpath)
+    return written
+
+
+def load_results(dest):
+    """Returns the results written by a run to dest as a dict of tables
+    (subjects, anova, descriptives and resampling if run) along with the
+    run info under 'info'. The subject table is returned as the
+    pyarrow.Table memory-mapped from its Feather file, so loading it costs
+    no more than opening the file and its columns are only read when used;
+    its to_pandas() copies them into a frame. The other tables are
+    frames."""
+    import pyarrow.feather as feather
+    with open(join(dest, RESULTS_NAME)) as f:
+        results = json.load(f)
+    tables = {'subjects': feather.read_table(join(dest, results['subjects']), memory_map=True)}
+    for name in list(results['files']):
+        if name != 'subjects':
+            tables[name] = pd.DataFrame.from_records(results.pop(name))
+    tables['info'] = results
+    return tables
+
+
+def watch_logs(source, interval=2.0, jobs=1, cache=None):
+    """Reports the per-set summary and the ANOVAs of the logs in source,
+    then polls the folder and updates them as sessions finish, until
+    interrupted. A poll stats the logs that were not finished yet and,
+    when the folder changed (a log was added, removed or renamed, as
+    MakeLog does when a session is re-run), every listed log. Only a log
+    whose size, mtime or inode changed is read, and the summary is updated
+    by adding and removing single records. A log counts once its last
+    score line (RecMem-Pos) has been written. A log that cannot be read is
+    reported and read again once it changes, and an error during a poll is
+    reported without ending the watch."""
+    files = sorted(glob.glob(source + "/*.txt"))
+    paths = dict((get_file_name(F), F) for F in files)
     try:
-        rpt_headers = "ID,Set,digitime,File_Create,LDI_Neg_Low_Sim,LDI_Neg_High_Sim,LDI_Neut_High_Sim,LDI_Pos_Low_Sim,LDI_Neg_Collapsed," \
-                      "LDI_Neut_Collapsed,LDI_Pos_Collapsed,RecMem_Neg,RecMem_Neu,RecMem_Pos"
-        rpt_dic = rpt_headers.replace(',', '= '' ,') + '='''
-        rpt_dic = dict(x.split("=") for x in rpt_dic.split(','))
-        return rpt_dic
-    except:
-        return None
+        records = dict((paths[record[-1]], record) for record in ingest_logs(files, jobs, cache, source)[0]
+                       if is_finished(record))
+    except Exception:
+        print("Could not read the logs in one pass (%s), reading them one by one" % sys.exc_info()[1])
+        records = {}
+    summary = {}
+    for record in records.values():
+        update_summary(summary, record, 1)
+    stats = {}
+    pending = set(F for F in files if F not in records)
+    for F in records:
+        stats[F] = get_file_key(os.stat(F))
+    folder_time = None
+    print_watch_report(records, summary, "Watching %s" % source)
+    try:
+        while True:
+            try:
+                changed, errors = [], []
+                current = os.stat(source).st_mtime_ns
+                candidates = set(pending)
+                if current != folder_time:
+                    folder_time = current
+                    listed = set(glob.glob(source + "/*.txt"))
+                    for F in set(stats) - listed:
+                        del stats[F]
+                        pending.discard(F)
+                        if F in records:
+                            update_summary(summary, records.pop(F), -1)
+                            changed.append('-' + get_file_name(F))
+                    candidates |= listed
+                for F in candidates:
+                    try:
+                        key = get_file_key(os.stat(F))
+                    except OSError:
+                        continue
+                    if stats.get(F) == key:
+                        continue
+                    stats[F] = key
+                    try:
+                        record = parse_log(F)[0]
+                    except Exception:
+                        errors.append("%s: %s" % (get_file_name(F), sys.exc_info()[1]))
+                        record = None
+                    if F in records:
+                        update_summary(summary, records.pop(F), -1)
+                        changed.append('-' + get_file_name(F))
+                    if record is not None and is_finished(record):
+                        record = record + (get_file_name(F),)
+                        records[F] = record
+                        update_summary(summary, record, 1)
+                        pending.discard(F)
+                        changed.append('+' + get_file_name(F))
+                    else:
+                        pending.add(F)
+                for error in errors:
+                    print("\n[%s] Could not read %s" % (datetime.now().strftime('%H:%M:%S'), error))
+                if changed:
+                    print_watch_report(records, summary, ' '.join(sorted(changed)))
+            except Exception:
+                print("\n[%s] Poll failed: %s" % (datetime.now().strftime('%H:%M:%S'), sys.exc_info()[1]))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\nStopped watching %s" % source)
+
+
+def get_file_key(st):
+    """Returns what tells whether a log changed between polls: size,
+    mtime and inode (a log replaced by a new one of the same name)."""
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def is_finished(record):
+    return record is not None and not np.isnan(record[RPT_HEADERS.index('RecMem_Pos')])
+
+
+def update_summary(summary, record, sign):
+    """Adds (sign 1) or removes (sign -1) a report record from the running
+    count, sum and sum of squares of DEPVARS of its set."""
+    values = np.array([record[RPT_HEADERS.index(col)] for col in DEPVARS], dtype=float)
+    count, total, squares = summary.get(record[1], (0, np.zeros(len(DEPVARS)), np.zeros(len(DEPVARS))))
+    summary[record[1]] = (count + sign, total + sign * values, squares + sign * values ** 2)
+    if summary[record[1]][0] == 0:
+        del summary[record[1]]
+
+
+def get_summary_frame(summary):
+    """Returns the mean and std (ddof 1) of DEPVARS by set from the running
+    sums of update_summary."""
+    frames = {}
+    for Set, (count, total, squares) in sorted(summary.items()):
+        mean = total / count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(np.maximum(squares - count * mean ** 2, 0) / (count - 1))
+        frames[(Set, 'mean')] = mean
+        frames[(Set, 'std')] = std
+        frames[(Set, 'N')] = np.full(len(DEPVARS), count)
+    return pd.DataFrame(frames, index=DEPVARS)
+
+
+def print_watch_report(records, summary, event):
+    """Prints the per-set summary, then the ANOVAs of the subjects with at
+    least two finished sessions."""
+    subjects = set(record[0] for record in records.values())
+    print("\n[%s] %s" % (datetime.now().strftime('%H:%M:%S'), event))
+    print("%d finished sessions, %d subjects\n" % (len(records), len(subjects)))
+    if summary:
+        print(get_summary_frame(summary).round(3).to_string())
+    df_rpt = get_complete_subjects(pd.DataFrame.from_records(list(records.values()), columns=RPT_HEADERS))
+    if len(df_rpt):
+        print("\nRepeated Measures ANOVA (within: inst), %d subjects with two sessions\n"
+              % df_rpt['ID'].nunique())
+        try:
+            print(get_anova(df_rpt)[0].to_string(index=False))
+        except Exception:
+            print("ANOVA failed: %s" % sys.exc_info()[1])
+
+
+def ingest_logs(files, jobs=1, cache=None, source=None):
+    """Parses every log file and returns the report records of the scored
+    logs as a list of tuples in RPT_HEADERS order, along with the
+    (file name, ID, Set, trial blocks) of every log. The report frame is built once
+    from the records, so ingestion time grows linearly with the logs.
+    If cache is the path of a parse cache, only new or changed logs are
+    parsed, and entries are evicted from the source folder only (see
+    read_cached)."""
+    if cache is None:
+        results = parse_files(files, jobs)
+    else:
+        results = read_cached(files, jobs, cache, source)
+    records = []
+    trial_logs = []
+    for F, (record, blocks) in zip(files, results):
+        fname = get_file_name(F)
+        if record is not None:
+            records.append(record + (fname,))
+        trial_logs.append((fname,) + record_id(F) + (blocks,))
+    return records, trial_logs
+
+
+def parse_files(files, jobs=1):
+    """Parses log files and returns their (record, blocks) in the order of
+    files. With more than one job, files are parsed in chunks by a process
+    pool; results are merged in the order of files, so output is the same."""
+    if jobs > 1 and len(files) > 1:
+        chunksize = max(1, len(files) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(parse_log, files, chunksize=chunksize))
+    return [parse_log(F) for F in files]
+
+
+def read_cached(files, jobs, cache, source=None):
+    """Returns the parsed (record, blocks) of log files through an SQLite
+    parse cache keyed on absolute path, size and mtime. Unchanged logs are
+    read from the cache, new or changed logs are parsed and stored, and
+    entries of logs that no longer exist in the source folder (by default,
+    the folders of files) are evicted, so folders sharing a cache keep
+    their entries. Entries written by another version of the parser
+    (get_cache_version) count as changed."""
+    conn = sqlite3.connect(cache)
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(logs)')]
+    if columns and 'version' not in columns:
+        with conn:
+            conn.execute('DROP TABLE logs')
+    conn.execute('CREATE TABLE IF NOT EXISTS logs (path TEXT PRIMARY KEY, size INTEGER, '
+                 'mtime REAL, version TEXT, record TEXT, blocks TEXT)')
+    version = get_cache_version()
+    cached = dict((row[0], row[1:]) for row in
+                  conn.execute('SELECT path, size, mtime, version, record, blocks FROM logs'))
+    keys = [path.abspath(F) for F in files]
+    stats = [os.stat(F) for F in files]
+    results = [None] * len(files)
+    misses = []
+    for i, (key, stat) in enumerate(zip(keys, stats)):
+        row = cached.get(key)
+        if row is not None and row[:3] == (stat.st_size, stat.st_mtime, version):
+            results[i] = decode_cache_row(row[3], row[4])
+        else:
+            misses.append(i)
+    for i, result in zip(misses, parse_files([files[i] for i in misses], jobs)):
+        results[i] = result
+    if source is None:
+        folders = set(path.dirname(key) for key in keys)
+    else:
+        folders = set([path.abspath(source)])
+    evicted = set(key for key in cached if path.dirname(key) in folders) - set(keys)
+    with conn:
+        conn.executemany('DELETE FROM logs WHERE path = ?', [(key,) for key in evicted])
+        conn.executemany('INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?, ?, ?)',
+                         [(keys[i], stats[i].st_size, stats[i].st_mtime, version) +
+                          encode_cache_row(*results[i]) for i in misses])
+    conn.close()
+    print("Parse cache: %d hits, %d misses, %d evicted" %
+          (len(files) - len(misses), len(misses), len(evicted)))
+    return results
+
+
+def get_cache_version():
+    """Returns the version stored with each parse cache entry: CACHE_VERSION
+    and the report headers, so a change of either invalidates the cache."""
+    return '%d:%s' % (CACHE_VERSION, ','.join(RPT_HEADERS))
+
+
+def encode_cache_row(record, blocks):
+    """Serializes a parsed log for the cache. File_Create is left out and
+    rebuilt from digitime when decoding."""
+    if record is not None:
+        record = record[:3] + record[4:]
+    return json.dumps(record), json.dumps(blocks)
+
+
+def decode_cache_row(record, blocks):
+    """Rebuilds a parsed log from its cache entry."""
+    record = json.loads(record)
+    if record is not None:
+        record = tuple(record[:3]) + (datetime.fromtimestamp(record[2]),) + tuple(record[3:])
+    return record, [tuple(block) for block in json.loads(blocks)]
+
+
+def parse_log(F):
+    """Reads one log file and returns its report record (None if the log
+    has no scores) and its trial blocks."""
+    digitime = os.stat(F).st_mtime
+    with open(F, 'r') as mfile:
+        log_text = mfile.read()
+    return parse_log_text(get_file_name(F), log_text, digitime)
+
+
+def parse_log_text(fname, log_text, digitime):
+    """Parses the text of a log named fname, last modified at digitime."""
+    ID, Set = record_id(fname)
+    blocks = get_trial_blocks(log_text)
+    scores = dict(SCORE_LINE.findall(log_text, max(log_text.rfind('Scores:'), 0)))
+    if 'LDI-Negative Low Sim' not in scores:
+        return None, blocks
+    values = dict((SCORE_FIELDS[k], float(v)) for k, v in scores.items() if k in SCORE_FIELDS)
+    record = (ID, Set, digitime, datetime.fromtimestamp(digitime)) + \
+        tuple(values.get(field, np.nan) for field in RPT_HEADERS[4:-1])
+    return record, blocks
+
+
+def record_id(pname):
+    """Returns the subject ID and set of a log from its file name."""
+    IDParts = get_file_name(pname).split('_')
+    return IDParts[0], IDParts[1]
+
+
+def get_trial_blocks(log_text):
+    """Returns the study and test trial tables of a log as a list of
+    (phase, header, rows, row count), where header and rows are CSV text."""
+    blocks = []
+    for phase in ('Study', 'Test'):
+        start = log_text.find('Begin %s\n\n' % phase)
+        if start < 0:
+            continue
+        start += len(phase) + 8
+        end = log_text.find('\n\n', start)
+        if end < 0:
+            end = len(log_text)
+        header, _, rows = log_text[start:end].rstrip('\n').partition('\n')
+        if rows:
+            blocks.append((phase, header, rows, rows.count('\n') + 1))
+    return blocks
+
+
+def get_trial_table(trial_logs):
+    """Builds one long-format table of every trial from the trial blocks of
+    all logs. Blocks sharing a phase and header are joined and parsed with a
+    single read_csv, and the subject, set and log columns are filled with
+    np.repeat over the row counts, so no Python loop runs per trial."""
+    groups = {}
+    for fname, ID, Set, blocks in trial_logs:
+        for phase, header, rows, nrows in blocks:
+            group = groups.setdefault((phase, header), ([], [], [], [], []))
+            group[0].append(ID)
+            group[1].append(Set)
+            group[2].append(fname)
+            group[3].append(rows)
+            group[4].append(nrows)
+    frames = []
+    for (phase, header), (ids, sets, fnames, rows, nrows) in groups.items():
+        df = pd.read_csv(io.StringIO('\n'.join(rows)), header=None,
+                         names=header.split(','), dtype=str, na_filter=False)
+        df = df.rename(columns=TRIAL_COLUMNS)
+        df.insert(0, 'subject', np.repeat(ids, nrows))
+        df.insert(1, 'set', np.repeat(sets, nrows))
+        df.insert(2, 'log', np.repeat(fnames, nrows))
+        df.insert(3, 'phase', phase)
+        frames.append(df)
+    columns = ['subject', 'set', 'log', 'phase', 'trial', 'image', 'type', 'valence',
+               'key', 'rt', 'onset', 'offset']
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(frames, ignore_index=True)
+    df['valence'] = get_image_field(df['image'], 'valence')
+    for col in ['trial', 'rt', 'onset', 'offset']:
+        if col not in df:
+            df[col] = np.nan
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['trial'] = df['trial'].astype('int32')
+    df = df[columns]
+    for col in ['subject', 'set', 'log', 'phase', 'image', 'type', 'valence', 'key']:
+        df[col] = df[col].astype('category')
+    return df
+
+
+def get_image_field(images, field):
+    """Returns one field of the manifest coding (Emo_Manifest.classify) of
+    each image, classifying every distinct image name once."""
+    images = images.astype('category')
+    coding = dict((image, (Emo_Manifest.classify(image) or {}).get(field))
+                  for image in images.cat.categories)
+    return images.map(coding).astype(object)
 
 
 def get_file_name(pname):
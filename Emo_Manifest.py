@@ -0,0 +1,240 @@
+'''
+
+*****************************************************************
+Title                           Emo PS Manifest
+Purpose                         Builds and loads the manifest of
+                                a stimuli set, the single index
+                                of its images and their coding
+*****************************************************************
+
+Stimulus file names code the image: the first digit is the valence and
+the role (1-3 lures, 4-6 repeats, 7-9 foils, in Neg, Neu, Pos order), the
+last four digits the image number, whose first 25 are low arousal, and a
+trailing letter the lure version (a is studied, b/d are low similarity and
+c/e high similarity lures). classify() is the one place that reads these
+names; every other module uses its fields. classify_names() applies the
+same coding to a whole column of paths at once.
+
+Each set folder holds a manifest.json listing every image with its coding,
+dimensions and content hash, so the task loads the set with one read
+instead of listing and parsing the folder. The manifest is built the first
+time a set is loaded. Each entry keeps the size and modification time of
+its file, and loading a set compares them with the folder, so images that
+were added, removed or replaced are measured again and the manifest is
+rewritten. Running this module rebuilds the manifests from scratch:
+
+    python Emo_Manifest.py stimuli/setA stimuli/setB stimuli/setC
+
+'''
+
+import os
+import json
+import hashlib
+import argparse
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 2
+VALENCES = ['Neg', 'Neu', 'Pos']
+ROLES = {'1': 'Lure', '2': 'Lure', '3': 'Lure', '4': 'Repeat', '5': 'Repeat', '6': 'Repeat',
+         '7': 'Foil', '8': 'Foil', '9': 'Foil'}
+SIMILARITY = {'b': 'LOW', 'd': 'LOW', 'c': 'HIGH', 'e': 'HIGH'}
+LOW_AROUSAL = 25
+PATH_PATTERN = (r'(?:^|[\\/])(?:(?P<folder>[^\\/]*)[\\/])?'
+                r'(?P<file>(?P<digit>[1-9])(?P<number>\d{4})(?P<letter>[a-e]?)\.(?i:jpg))$')
+
+
+def classify(fname):
+    """Returns the coding of a stimulus file name as a dict, or None if the
+    name does not follow the stimulus naming scheme.
+
+        valence     Neg, Neu or Pos
+        role        LureA to LureE, Repeat or Foil
+        trial_type  trial type written to the logs (LureB, R-Neg, F-Pos...)
+        sim         LOW or HIGH for lures b-e, None otherwise
+        arousal     LOW or HIGH
+        study       shown in the study phase (a lures and repeats)
+        test        shown in the test phase (everything but a lures)
+    """
+    name, ext = os.path.splitext(fname.replace('\\', '/').rsplit('/', 1)[-1])
+    letter = name[-1:] if name[-1:].isalpha() else ''
+    number = name[:-1] if letter else name
+    if ext.lower() != '.jpg' or len(number) != 5 or not number.isdigit() or \
+            number[0] not in ROLES or letter not in ('', 'a', 'b', 'c', 'd', 'e'):
+        return None
+    valence = VALENCES[(int(number[0]) - 1) % 3]
+    role = ROLES[number[0]]
+    if role == 'Lure':
+        if not letter:
+            return None
+        role = 'Lure' + letter.upper()
+        trial_type = role
+    else:
+        trial_type = role[0] + '-' + valence
+    return {'valence': valence,
+            'role': role,
+            'trial_type': trial_type,
+            'sim': SIMILARITY.get(letter),
+            'arousal': 'LOW' if int(number[1:]) <= LOW_AROUSAL else 'HIGH',
+            'study': role in ('LureA', 'Repeat'),
+            'test': role != 'LureA'}
+
+
+def classify_names(paths, fields=None):
+    """Classifies a column of image paths (or file names) at once and
+    returns a frame with the same index holding their folder and file names
+    and the fields of classify() as categoricals. Rows that are not stimuli
+    get missing values. fields adds columns computed from the classify()
+    dict by the given functions, e.g. {'lure': lambda c: c['sim'] or 'not'}.
+
+    One regex extracts the valence digit, image number and lure letter of
+    every path. Only the few distinct digit/letter pairs go through
+    classify() and fields, and every row takes its values from its pair by
+    code.
+    """
+    import numpy as np     #Only needed to classify in bulk, not to load a manifest
+    import pandas as pd
+    paths = pd.Series(paths)
+    folder, file, pairs, number = extract_parts(paths)
+    codings = [classify(pair[0] + '0000' + pair[1:] + '.jpg') for pair in pairs.categories]
+    valid = np.array([coding is not None for coding in codings] + [False])[pairs.codes]
+    df = pd.DataFrame({'folder': folder, 'file': file}, index=paths.index)
+    functions = [(field, lambda coding, field=field: coding[field])
+                 for field in ['valence', 'role', 'trial_type', 'sim']]
+    for field, function in functions + sorted((fields or {}).items()):
+        values = [None if coding is None else function(coding) for coding in codings]
+        categories = sorted(set(value for value in values if value is not None))
+        codes = np.array([-1 if value is None else categories.index(value) for value in values] + [-1])
+        df[field] = pd.Categorical.from_codes(codes[pairs.codes], categories)
+    low = number <= LOW_AROUSAL
+    df['arousal'] = pd.Categorical.from_codes(np.where(valid, np.where(low, 1, 0), -1), ['HIGH', 'LOW'])
+    for field in ['study', 'test']:
+        flags = np.array([coding is not None and coding[field] for coding in codings] + [False])
+        df[field] = flags[pairs.codes]
+    return df
+
+
+def extract_parts(paths):
+    """Matches PATH_PATTERN against a series of paths and returns their
+    folder and file names, their digit/letter pairs as a Categorical and
+    their image numbers (an int array). The regex runs in pyarrow when it
+    is installed, which is several times faster than pandas' str.extract.
+    """
+    import numpy as np
+    import pandas as pd
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        pa = None
+    if pa is None:
+        parts = paths.astype(object).str.extract(PATH_PATTERN)
+        number = pd.to_numeric(parts['number']).fillna(0).to_numpy(dtype=np.int64)
+        return (parts['folder'].to_numpy(), parts['file'].to_numpy(),
+                pd.Categorical(parts['digit'] + parts['letter']), number)
+    parts = pc.extract_regex(pa.array(paths, type=pa.string()), PATH_PATTERN)
+    field = lambda name: pc.struct_field(parts, name)
+    pairs = pc.binary_join_element_wise(field('digit'), field('letter'), '').dictionary_encode()
+    codes = pairs.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+    number = pc.cast(field('number'), pa.int64()).fill_null(0).to_numpy(zero_copy_only=False)
+    folder = field('folder')
+    folder = pc.if_else(pc.equal(folder, ''), pa.scalar(None, pa.string()), folder)
+    return (pd.array(folder, dtype='string[pyarrow]'),
+            pd.array(field('file'), dtype='string[pyarrow]'),
+            pd.Categorical.from_codes(codes, pairs.dictionary.to_pylist()), number)
+
+
+def get_manifest_path(set_dir):
+    return os.path.join(set_dir, MANIFEST_NAME)
+
+
+def list_images(set_dir):
+    """Returns the stimulus files of a set folder as a dict of file name to
+    (size, modification time in ns), from one listing of the folder."""
+    files = {}
+    for item in os.scandir(set_dir):
+        if item.is_file() and classify(item.name) is not None:
+            st = item.stat()
+            files[item.name] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def build_manifest(set_dir, previous=None):
+    """Lists, classifies, measures and hashes the images of a set folder
+    and returns its manifest. Files that are not stimuli are skipped. The
+    entries of a previous manifest are kept for files whose size and
+    modification time have not changed."""
+    from PIL import Image   #Only needed to build, not to load, a manifest
+    kept = dict((entry['file'], entry) for entry in (previous or {}).get('images', []))
+    images = []
+    for fname, (size, mtime) in sorted(list_images(set_dir).items()):
+        entry = kept.get(fname)
+        if entry is not None and (entry['bytes'], entry['mtime_ns']) == (size, mtime):
+            images.append(entry)
+            continue
+        fpath = os.path.join(set_dir, fname)
+        with open(fpath, 'rb') as f:
+            data = f.read()
+        with Image.open(fpath) as im:
+            width, height = im.size
+        entry = dict(file=fname, width=width, height=height, bytes=len(data), mtime_ns=mtime,
+                     sha1=hashlib.sha1(data).hexdigest(), **classify(fname))
+        images.append(entry)
+    return {'version': MANIFEST_VERSION, 'set': os.path.basename(os.path.normpath(set_dir)),
+            'images': images}
+
+
+def write_manifest(set_dir, manifest=None):
+    """Builds the manifest of a set folder, unless given, and writes it to
+    the folder. The file is replaced atomically, so a task starting at the
+    same time never reads half a manifest."""
+    if manifest is None:
+        manifest = build_manifest(set_dir)
+    path = get_manifest_path(set_dir)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + '.tmp', path)
+    return manifest
+
+
+def is_current(manifest, set_dir):
+    """Tells whether a manifest lists exactly the stimulus files of its
+    folder, with the sizes and modification times they have now."""
+    files = list_images(set_dir)
+    return len(files) == len(manifest['images']) and \
+        all(files.get(entry['file']) == (entry['bytes'], entry['mtime_ns']) for entry in manifest['images'])
+
+
+def load_manifest(set_dir):
+    """Returns the manifest of a set folder, building and writing it if the
+    folder has none (or one of an older version), and updating it if files
+    were added, removed or changed since it was written."""
+    manifest = None
+    try:
+        with open(get_manifest_path(set_dir)) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != MANIFEST_VERSION:
+            manifest = None
+        elif is_current(manifest, set_dir):
+            return manifest
+    except (IOError, OSError, ValueError):
+        pass
+    return write_manifest(set_dir, build_manifest(set_dir, manifest))
+
+
+def get_images(manifest, phase=None):
+    """Returns the file names of the images of a manifest, only those of
+    phase ('study' or 'test') if given."""
+    return [entry['file'] for entry in manifest['images'] if phase is None or entry[phase]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the manifest of each stimuli set folder.")
+    parser.add_argument('sets', nargs='+', help="Stimuli set folders")
+    args = parser.parse_args()
+    for set_dir in args.sets:
+        manifest = write_manifest(set_dir)
+        print("%s: %d images" % (get_manifest_path(set_dir), len(manifest['images'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+'''
+
+*****************************************************************
+Title                           Emo PS Normalize
+Purpose                         Measures the low-level statistics
+                                of the stimuli (luminance, contrast
+                                and spatial frequency), tables them
+                                by set and valence, and optionally
+                                writes luminance and contrast
+                                normalized versions of the images
+*****************************************************************
+
+Every image is converted to luminance (Rec. 709 weights on the stored
+sRGB values, 0-1). Mean luminance and RMS contrast are measured at full
+resolution, the one --normalize works at; the image is then area-averaged
+to ANALYSIS_SIZE pixels square, and the spatial frequency statistics of a
+whole batch of images come from a few NumPy passes:
+
+    luminance   mean luminance
+    contrast    RMS contrast, the standard deviation of the luminance
+    sf_low      share of the spectral energy (DC excluded) below 8,
+    sf_mid      from 8 to 32, and
+    sf_high     above 32 cycles per image
+    sf_slope    slope of the log amplitude spectrum over log frequency
+
+The statistics of every image are kept in an index keyed by the SHA-1 of
+its file, so only new or changed images are decoded again, in a process
+pool, and the table of a set can be printed again at once.
+
+With --normalize, each image is written with its luminance shifted and
+scaled to the target mean and RMS contrast (by default, the averages of
+all the images given), its colour differences kept, to
+
+    stimuli/cache/normalized/<targets>/<sha1 of the source image>.png
+
+Pixels pushed out of 0-1 are clipped, which pulls the mean and contrast
+away from the targets, so the shift and scale are corrected until the
+clipped image is within TARGET_TOLERANCE of both (up to NORMALIZE_STEPS
+times). The share of clipped pixels and any image left off target are
+reported. Images already written for the same targets are skipped, and
+the table of the normalized images, measured the same way, is printed
+too.
+
+    python Emo_Normalize.py stimuli/setA stimuli/setB stimuli/setC --normalize
+
+'''
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import Emo_Manifest
+import Emo_Resize
+import Emo_Similarity
+
+INDEX_NAME = 'image_stats.npz'
+NORMALIZED_LOC = 'normalized'
+ANALYSIS_SIZE = 256
+LUMA = np.array([0.2126, 0.7152, 0.0722])
+SF_BANDS = {'sf_low': (1, 8), 'sf_mid': (8, 32), 'sf_high': (32, ANALYSIS_SIZE // 2)}
+STAT_COLUMNS = ['luminance', 'contrast', 'sf_low', 'sf_mid', 'sf_high', 'sf_slope']
+CHUNK_SIZE = 256        #Images per vectorized batch
+INDEX_VERSION = 2       #Bump when the statistics change, to measure every image again
+NORMALIZE_STEPS = 20
+TARGET_TOLERANCE = 0.001
+
+
+def get_cache_root(set_dirs):
+    """Returns the derivative store next to the first set folder."""
+    return os.path.join(os.path.dirname(os.path.normpath(set_dirs[0])), Emo_Resize.CACHE_LOC)
+
+
+def to_luminance(pixels):
+    """Returns the luminance (0-1) of an RGB uint8 array."""
+    return pixels.astype(np.float32) @ LUMA.astype(np.float32) / 255
+
+
+def load_luminance(fpath):
+    """Decodes an image and returns its area-averaged luminance image of
+    ANALYSIS_SIZE pixels square, along with the mean luminance and RMS
+    contrast of the full resolution image."""
+    from PIL import Image   #Only needed to decode images, not to table their statistics
+    with Image.open(fpath) as im:
+        im = im.convert('RGB')
+        full = to_luminance(np.asarray(im))
+        small = im.resize((ANALYSIS_SIZE, ANALYSIS_SIZE), Image.BOX)
+        return to_luminance(np.asarray(small)), float(full.mean()), float(full.std())
+
+
+def get_frequency_bins():
+    """Returns the radial frequency, in whole cycles per image, of every
+    coefficient of the real 2D FFT of an analysis image."""
+    fy = np.fft.fftfreq(ANALYSIS_SIZE) * ANALYSIS_SIZE
+    fx = np.fft.rfftfreq(ANALYSIS_SIZE) * ANALYSIS_SIZE
+    return np.rint(np.hypot(fy[:, None], fx[None, :])).astype(np.int64).ravel()
+
+
+def get_stats(luminance):
+    """Returns the statistics (STAT_COLUMNS) of a stack of luminance images
+    as a dict of arrays."""
+    n = len(luminance)
+    stats = {'luminance': luminance.mean(axis=(1, 2)), 'contrast': luminance.std(axis=(1, 2))}
+    power = np.abs(np.fft.rfft2(luminance)) ** 2
+    #Coefficients of the half spectrum that stand for two of the full one count twice
+    weights = np.full(power.shape[1:], 2.0)
+    weights[:, 0] = 1
+    if ANALYSIS_SIZE % 2 == 0:
+        weights[:, -1] = 1
+    power = (power * weights).reshape(n, -1)
+    bins = get_frequency_bins()
+    n_bins = ANALYSIS_SIZE // 2
+    valid = (bins >= 1) & (bins <= n_bins)
+    onehot = np.zeros((valid.sum(), n_bins))
+    onehot[np.arange(valid.sum()), bins[valid] - 1] = 1
+    radial = power[:, valid] @ onehot
+    total = radial.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for name, (low, high) in SF_BANDS.items():
+            stats[name] = radial[:, low - 1:high - 1].sum(axis=1) / total
+        stats['sf_high'] = stats['sf_high'] + radial[:, n_bins - 1] / total
+        #Amplitude per coefficient of each radial bin, fitted over log frequency
+        amplitude = np.sqrt(radial / np.maximum(onehot.sum(axis=0), 1))
+        x = np.log(np.arange(1, n_bins + 1))
+        y = np.log(np.maximum(amplitude, 1e-12))
+        x = x - x.mean()
+        stats['sf_slope'] = (y - y.mean(axis=1, keepdims=True)) @ x / (x @ x)
+    return stats
+
+
+def load_index(fpath):
+    if os.path.isfile(fpath):
+        with np.load(fpath) as saved:
+            if 'version' in saved.files and int(saved['version']) == INDEX_VERSION:
+                return dict((key, saved[key]) for key in saved.files)
+    index = {'version': np.array(INDEX_VERSION), 'sha1': np.array([], dtype='U40')}
+    index.update((column, np.array([])) for column in STAT_COLUMNS)
+    return index
+
+
+def measure_images(images, index_path, jobs=1):
+    """Returns the statistics of images (sha1 -> path) as a frame indexed by
+    SHA-1, along with the number of images decoded. Only images missing
+    from the statistics index are decoded, in a process pool, and added to
+    it."""
+    index = load_index(index_path)
+    todo = sorted(set(images) - set(index['sha1'].tolist()))
+    for start in range(0, len(todo), CHUNK_SIZE):
+        chunk = todo[start:start + CHUNK_SIZE]
+        paths = [images[sha1] for sha1 in chunk]
+        if jobs > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                loaded = list(pool.map(load_luminance, paths, chunksize=8))
+        else:
+            loaded = [load_luminance(fpath) for fpath in paths]
+        small, means, stds = zip(*loaded)
+        stats = get_stats(np.stack(small))
+        #Luminance and contrast of the full resolution images, as normalized
+        stats['luminance'] = np.array(means)
+        stats['contrast'] = np.array(stds)
+        index['sha1'] = np.concatenate([index['sha1'], np.array(chunk, dtype='U40')])
+        for column in STAT_COLUMNS:
+            index[column] = np.concatenate([index[column], stats[column]])
+    if todo:
+        Emo_Similarity.save_index(index_path, index)
+    df = pd.DataFrame(dict((column, index[column]) for column in STAT_COLUMNS), index=index['sha1'])
+    return df.loc[list(images)], len(todo)
+
+
+def get_images(set_dirs):
+    """Returns the images of the set folders as a frame (set, file, valence,
+    role, sha1, path). The manifests are built afresh, so the hashes are
+    those of the files as they are now."""
+    rows = []
+    for set_dir in set_dirs:
+        manifest = Emo_Manifest.build_manifest(set_dir)
+        for entry in manifest['images']:
+            rows.append((manifest['set'], entry['file'], entry['valence'], entry['role'], entry['sha1'],
+                         os.path.join(set_dir, entry['file'])))
+    return pd.DataFrame(rows, columns=['set', 'file', 'valence', 'role', 'sha1', 'path'])
+
+
+def get_stats_table(df):
+    """Returns the mean and standard deviation of each statistic by set and
+    valence."""
+    return df.groupby(['set', 'valence'])[STAT_COLUMNS].agg(['mean', 'std'])
+
+
+def get_targets_name(luminance, contrast):
+    return 'lum%.4f_rms%.4f' % (luminance, contrast)
+
+
+def normalize_image(job):
+    """Writes an image with its luminance shifted and scaled to the target
+    mean and RMS contrast. The same change is added to the three channels,
+    so the colour differences are kept. The result is clipped to 0-1, and
+    the shift and scale are corrected for the clipping until the mean and
+    RMS contrast are within TARGET_TOLERANCE of the targets. Returns the
+    mean and RMS contrast reached (before rounding to 8 bits) and the share
+    of pixels clipped."""
+    from PIL import Image
+    src, dest, luminance, contrast = job
+    with Image.open(src) as im:
+        pixels = np.asarray(im.convert('RGB')).astype(np.float32) / 255
+    luma = LUMA.astype(np.float32)
+    lum = pixels @ luma
+    deviation = lum - lum.mean()
+    scale = contrast / max(float(lum.std()), 1e-6)
+    shift = luminance
+    for step in range(NORMALIZE_STEPS):
+        shifted = pixels + (shift + deviation * scale - lum)[:, :, None]
+        out = np.clip(shifted, 0, 1)
+        out_lum = out @ luma
+        reached = (float(out_lum.mean()), float(out_lum.std()))
+        if abs(reached[0] - luminance) <= TARGET_TOLERANCE and abs(reached[1] - contrast) <= TARGET_TOLERANCE:
+            break
+        scale = scale * contrast / max(reached[1], 1e-6)
+        shift = shift + luminance - reached[0]
+    clipped = float(((shifted < 0) | (shifted > 1)).any(axis=2).mean())
+    Image.fromarray(np.rint(out * 255).astype(np.uint8)).save(dest + '.tmp', 'PNG', compress_level=1)
+    os.replace(dest + '.tmp', dest)
+    return reached + (clipped,)
+
+
+def write_normalized(df_images, cache_root, luminance, contrast, jobs=1):
+    """Writes the normalized version of every image missing from the cache
+    folder of the targets, and returns the images with their normalized
+    paths (path), along with a frame of the images written (path, and the
+    luminance, contrast and clipped share from normalize_image)."""
+    folder = os.path.join(cache_root, NORMALIZED_LOC, get_targets_name(luminance, contrast))
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    dests = [os.path.join(folder, sha1 + '.png') for sha1 in df_images['sha1']]
+    todo = [(src, dest, luminance, contrast) for src, dest in zip(df_images['path'], dests)
+            if not os.path.isfile(dest)]
+    todo = list(dict((job[1], job) for job in todo).values())
+    if jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(normalize_image, todo, chunksize=4))
+    else:
+        results = [normalize_image(job) for job in todo]
+    df_written = pd.DataFrame(results, columns=['luminance', 'contrast', 'clipped'],
+                              index=[job[1] for job in todo])
+    return df_images.assign(path=dests), df_written
+
+
+def get_normalize_summary(df_written, luminance, contrast):
+    """Returns a summary of the clipping and of the images left off target
+    by more than TARGET_TOLERANCE."""
+    if not len(df_written):
+        return "No image written"
+    off = ((df_written['luminance'] - luminance).abs() > TARGET_TOLERANCE) | \
+        ((df_written['contrast'] - contrast).abs() > TARGET_TOLERANCE)
+    summary = "Clipped pixels: %.2f%% on average, %.2f%% at most; %d of %d images off target" % (
+        100 * df_written['clipped'].mean(), 100 * df_written['clipped'].max(), off.sum(), len(df_written))
+    for dest, row in df_written.loc[off].iterrows():
+        summary += "\n    %s: luminance %.4f, RMS contrast %.4f" % (os.path.basename(dest), row['luminance'],
+                                                                 row['contrast'])
+    return summary
+
+
+def main():
+    try:
+        error_log = "Data Parsed, Error Occured During, Record, Notes" + "\n"
+        error_level = "Reading arguments,"
+        parser = argparse.ArgumentParser(description="Tables the luminance, contrast and spatial frequency "
+                                         "statistics of the stimuli by set and valence, and optionally writes "
+                                         "normalized versions.")
+        parser.add_argument('sets', nargs='+', help="Stimuli set folders")
+        parser.add_argument('-o', '--out', help="CSV file the statistics of every image are written to")
+        parser.add_argument('--table', help="CSV file the table by set and valence is written to")
+        parser.add_argument('--normalize', action='store_true',
+                            help="Write luminance and contrast normalized versions to the cache")
+        parser.add_argument('--luminance', type=float, help="Target mean luminance, 0-1 (default: the mean "
+                            "of all the images)")
+        parser.add_argument('--contrast', type=float, help="Target RMS contrast (default: the mean of all "
+                            "the images)")
+        parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                            help="Number of worker processes decoding images")
+        args = parser.parse_args()
+        cache_root = get_cache_root(args.sets)
+        index_path = os.path.join(cache_root, INDEX_NAME)
+        error_level = "Listing images,"
+        df_images = get_images(args.sets)
+        error_level = "Measuring images," + index_path
+        start = time.perf_counter()
+        images = dict(zip(df_images['sha1'], df_images['path']))
+        df_stats, decoded = measure_images(images, index_path, args.jobs)
+        print("%s: %d images decoded, %d from the index in %.2f s\n" % (index_path, decoded,
+                                                                       len(images) - decoded,
+                                                                       time.perf_counter() - start))
+        df = df_images.join(df_stats, on='sha1')
+        df_table = get_stats_table(df)
+        print(df_table.round(3).to_string())
+        if args.out:
+            error_level = "Writing image statistics," + args.out
+            df.drop(columns=['path']).to_csv(args.out, index=False)
+        if args.table:
+            error_level = "Writing statistics table," + args.table
+            df_table.to_csv(args.table)
+        if args.normalize:
+            error_level = "Writing normalized images,"
+            luminance = args.luminance if args.luminance is not None else df['luminance'].mean()
+            contrast = args.contrast if args.contrast is not None else df['contrast'].mean()
+            start = time.perf_counter()
+            df_norm, df_written = write_normalized(df_images, cache_root, luminance, contrast, args.jobs)
+            written = len(df_written)
+            print("\nNormalized to luminance %.4f, RMS contrast %.4f: %d written, %d up to date in %.2f s"
+                  % (luminance, contrast, written, len(df_norm) - written, time.perf_counter() - start))
+            print(get_normalize_summary(df_written, luminance, contrast) + "\n")
+            error_level = "Measuring normalized images,"
+            hashes = [Emo_Similarity.get_sha1(fpath) for fpath in df_norm['path']]
+            df_norm = df_norm.assign(sha1=hashes)
+            df_stats, decoded = measure_images(dict(zip(hashes, df_norm['path'])), index_path, args.jobs)
+            print(get_stats_table(df_norm.join(df_stats, on='sha1')).round(3).to_string())
+    except SystemExit:
+        raise
+    except:
+        error_log = error_log + error_level + ',' + str(sys.exc_info()[1]) + '\n'
+        print(error_log)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+'''
+
+*****************************************************************
+Title                           Emo PS Resize
+Purpose                         Renders the stimuli of each set
+                                once at their display size for a
+                                given screen, so the task loads
+                                small lossless images instead of
+                                decoding and shrinking the JPEGs
+*****************************************************************
+
+The task shows every image scaled to fit a square of IMG_FILL times the
+smaller side of the window. For a display profile (screen size and fill)
+this module renders each image of a set at exactly that pixel size and
+saves it as a PNG in the derivative store:
+
+    stimuli/cache/<set>/<max size>/<sha1 of the source image>.png
+
+The source hash comes from the set manifest (Emo_Manifest), so changed
+images get new derivatives once their manifest is rebuilt. emomdt.py
+looks up the store for the size of its window and falls back to the
+JPEG of any image without a matching derivative.
+
+    python Emo_Resize.py --screen 1920x1080 stimuli/setA stimuli/setB stimuli/setC
+
+'''
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import Emo_Manifest
+
+CACHE_LOC = 'cache'
+IMG_FILL = 0.8
+
+
+def get_max_size(screen, fill=IMG_FILL):
+    """Returns the size, in pixels, of the square images are fitted in on a
+    screen of (width, height), as computed by the task."""
+    return fill * min(screen[0], screen[1])
+
+
+def get_cache_dir(set_dir, max_size):
+    """Returns the derivative folder of a set for a maximum image size."""
+    set_dir = os.path.normpath(set_dir)
+    return os.path.join(os.path.dirname(set_dir), CACHE_LOC, os.path.basename(set_dir),
+                        '%g' % max_size)
+
+
+def get_derivative_path(cache_dir, entry):
+    return os.path.join(cache_dir, entry['sha1'] + '.png')
+
+
+def get_pixel_size(size, max_size):
+    """Returns the (width, height) in whole pixels of an image of size
+    scaled so its larger side is max_size, preserving its aspect ratio."""
+    scale = max(size) / max_size
+    return int(round(size[0] / scale)), int(round(size[1] / scale))
+
+
+def resize_image(im, max_size):
+    """Returns an RGB copy of a PIL image resized to its display size."""
+    from PIL import Image   #Only needed to render, not to look up, derivatives
+    im = im.convert('RGB')
+    return im.resize(get_pixel_size(im.size, max_size), Image.LANCZOS)
+
+
+def render(job):
+    """Renders one source image to its derivative path."""
+    from PIL import Image
+    src, dest, max_size = job
+    with Image.open(src) as im:
+        im = resize_image(im, max_size)
+    im.save(dest + '.tmp', 'PNG', compress_level=1)
+    os.replace(dest + '.tmp', dest)
+    return dest
+
+
+def build_cache(set_dir, max_size, jobs=1):
+    """Renders every image of a set that has no derivative yet for
+    max_size, and returns (rendered, skipped) counts."""
+    manifest = Emo_Manifest.load_manifest(set_dir)
+    cache_dir = get_cache_dir(set_dir, max_size)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    todo = []
+    for entry in manifest['images']:
+        dest = get_derivative_path(cache_dir, entry)
+        if not os.path.isfile(dest):
+            todo.append((os.path.join(set_dir, entry['file']), dest, max_size))
+    if jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            list(pool.map(render, todo))
+    else:
+        for job in todo:
+            render(job)
+    return len(todo), len(manifest['images']) - len(todo)
+
+
+def main():
+    try:
+        error_log = "Data Parsed, Error Occured During, Record, Notes" + "\n"
+        error_level = "Reading arguments,"
+        parser = argparse.ArgumentParser(description="Renders the stimuli of each set at their display size "
+                                         "for a screen.")
+        parser.add_argument('sets', nargs='+', help="Stimuli set folders")
+        parser.add_argument('--screen', required=True, help="Screen size of the display profile, as WxH")
+        parser.add_argument('--fill', type=float, default=IMG_FILL,
+                            help="Proportion of the smaller screen side filled by the images")
+        parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                            help="Number of worker processes rendering images")
+        args = parser.parse_args()
+        screen = [int(side) for side in args.screen.lower().split('x')]
+        max_size = get_max_size(screen, args.fill)
+        for set_dir in args.sets:
+            error_level = "Rendering derivatives," + set_dir
+            start = time.perf_counter()
+            rendered, skipped = build_cache(set_dir, max_size, args.jobs)
+            print("%s: %d rendered, %d up to date in %.2f s" % (get_cache_dir(set_dir, max_size), rendered,
+                                                               skipped, time.perf_counter() - start))
+    except SystemExit:
+        raise
+    except:
+        error_log = error_log + error_level + ',' + str(sys.exc_info()[1]) + '\n'
+        print(error_log)
+
+
+if __name__ == '__main__':
+    main()
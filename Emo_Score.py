@@ -0,0 +1,104 @@
+'''
+
+*****************************************************************
+Title                           Emo PS Score
+Purpose                         Scores test trials of the EmoDT
+                                task (LDI and RecMem) for one
+                                session or a whole cohort in a
+                                single vectorized pass
+*****************************************************************
+
+Each test trial is counted by valence (Neg, Neu, Pos), category (low
+similarity lure, high similarity lure, repeat, foil) and response (1 old,
+2 new) with one np.bincount over all trials, and every score is derived
+from those counts:
+
+    LDI Low/High Sim    P(new | low/high lure) - P(new | repeat)
+    LDI Collapsed       mean of the two lure P(new) - P(new | repeat)
+    RecMem              P(old | repeat) - P(old | foil)
+
+where each proportion is over the 1/2 responses of its category and is
+0 when there are none. These are the scores emomdt.py writes to its logs.
+
+'''
+
+import numpy as np
+import pandas as pd
+
+SCORE_LABELS = ['LDI-Negative Low Sim', 'LDI-Negative High Sim', 'LDI-Neutral Low Sim',
+                'LDI-Neutral High Sim', 'LDI-Positive Low Sim', 'LDI-Positive High Sim',
+                'LDI-Negative Collapsed', 'LDI-Neutral Collapsed', 'LDI-Positive Collapsed',
+                'RecMem-Neg', 'RecMem-Neu', 'RecMem-Pos']
+SCORE_COLUMNS = ['LDI_Neg_Low_Sim', 'LDI_Neg_High_Sim', 'LDI_Neut_Low_Sim', 'LDI_Neut_High_Sim',
+                 'LDI_Pos_Low_Sim', 'LDI_Pos_High_Sim', 'LDI_Neg_Collapsed', 'LDI_Neut_Collapsed',
+                 'LDI_Pos_Collapsed', 'RecMem_Neg', 'RecMem_Neu', 'RecMem_Pos']
+VALENCE_INDEX = {'1': 0, '2': 1, '3': 2, '4': 0, '5': 1, '6': 2, '7': 0, '8': 1, '9': 2,
+                 'Neg': 0, 'Neu': 1, 'Pos': 2}
+CATEGORY_INDEX = {'LureB': 0, 'LureD': 0, 'LureC': 1, 'LureE': 1,
+                  'R-Neg': 2, 'R-Neu': 2, 'R-Pos': 2, 'F-Neg': 3, 'F-Neu': 3, 'F-Pos': 3}
+RESPONSE_INDEX = {'1': 0, '2': 1}
+
+
+def get_counts(trial_type, valence, key, group=None, n_groups=1):
+    """Returns the response counts of test trials as an array of shape
+    (n_groups, valence, category, response). Trials of other types or
+    without a 1/2 response are ignored. group gives the group index
+    (0..n_groups-1) of each trial."""
+    cat = get_index(trial_type, CATEGORY_INDEX)
+    val = get_index(valence, VALENCE_INDEX)
+    resp = get_index(key, RESPONSE_INDEX)
+    if group is None:
+        group = np.zeros(len(cat), dtype=np.int64)
+    valid = ~(np.isnan(cat) | np.isnan(val) | np.isnan(resp))
+    index = ((np.asarray(group)[valid] * 3 + val[valid]) * 4 + cat[valid]) * 2 + resp[valid]
+    counts = np.bincount(index.astype(np.int64), minlength=n_groups * 24)
+    return counts.reshape(n_groups, 3, 4, 2)
+
+
+def get_index(values, mapping):
+    """Maps values through mapping to a float array, NaN where unmapped.
+    Only the distinct values are looked up; trials take theirs by code."""
+    values = pd.Categorical(values)
+    lookup = np.array([mapping.get(str(value), np.nan) for value in values.categories] + [np.nan])
+    return lookup[values.codes]
+
+
+def get_scores(counts):
+    """Returns the scores of response counts from get_counts, as an array
+    of shape (n_groups, 12) in SCORE_LABELS order."""
+    totals = counts.sum(axis=-1)
+    props = np.divide(counts, totals[..., None], out=np.zeros(counts.shape),
+                      where=totals[..., None] > 0)
+    low_crs = props[:, :, 0, 1]
+    high_crs = props[:, :, 1, 1]
+    misses = props[:, :, 2, 1]
+    hits = props[:, :, 2, 0]
+    old_foils = props[:, :, 3, 0]
+    ldi_sim = np.stack([low_crs - misses, high_crs - misses], axis=-1).reshape(-1, 6)
+    ldi_col = (low_crs + high_crs) / 2 - misses
+    rec_mem = hits - old_foils
+    return np.concatenate([ldi_sim, ldi_col, rec_mem], axis=1)
+
+
+def score_session(trial_type, valence, key):
+    """Scores the test trials of one session and returns a dict of score
+    label to value."""
+    scores = get_scores(get_counts(trial_type, valence, key))[0]
+    return dict(zip(SCORE_LABELS, scores))
+
+
+def score_table(df_trials, by, decimals=None):
+    """Scores the test trials of a trial table (columns type, valence, key)
+    for every group of the by columns, and returns a frame indexed by the
+    groups with one SCORE_COLUMNS column per score. With decimals, scores
+    are rounded like the logs."""
+    grouped = df_trials.groupby(by, observed=True, sort=False)
+    codes = grouped.ngroup().to_numpy()
+    groups = grouped.size().index
+    counts = get_counts(df_trials['type'], df_trials['valence'], df_trials['key'],
+                        codes, len(groups))
+    scores = get_scores(counts)
+    if decimals is not None:
+        #Rounded like '%.2f' in the logs, which np.round does not always match
+        scores = np.vectorize(lambda score: round(float(score), decimals), otypes=[float])(scores)
+    return pd.DataFrame(scores, index=groups, columns=SCORE_COLUMNS)
@@ -0,0 +1,157 @@
+'''
+
+*****************************************************************
+Title                           Emo PS Selection
+Purpose                         Draws mutually exclusive, balanced
+                                stimulus sets from an image pool
+                                according to a declarative config
+*****************************************************************
+
+A selection config lists quotas: how many units of a kind each set gets,
+per stratum. A quota selects candidates by any of the classify() fields
+(Emo_Manifest) and is repeated for every combination of its "by" fields:
+
+    {"sets": 3, "seed": 2021,
+     "quotas": [{"role": "Foil", "count": 5, "by": ["valence"]},
+                {"role": "Lure", "sim": "LOW", "count": 5, "by": ["valence"]},
+                ...]}
+
+A lure unit is an image number with one of its b-e versions, and brings
+its a version along, so every lure in a test phase has its studied image
+in the same set. Other units are single images. Each image number is used
+at most once across all sets, so the sets never share an image or a file
+name. Quotas are filled in order, lure quotas first. If the pool has a
+group column (set_groups), image numbers of the same group count as one:
+near-duplicate images never end up in two sets, nor in two roles of one.
+
+Within a quota, candidates are ranked by one seeded random key and a
+grouped cumcount over the strata; the first sets * count units of each
+stratum are dealt to the sets in turn. The whole draw is a handful of
+vectorized passes, whatever the pool size or number of sets, and the
+same seed and pool always give the same sets.
+
+'''
+
+import json
+import string
+import numpy as np
+import pandas as pd
+import Emo_Manifest
+
+DEFAULT_CONFIG = {
+    'sets': 3,
+    'seed': 2021,
+    'quotas': [{'role': 'Lure', 'sim': 'LOW', 'count': 5, 'by': ['valence']},
+               {'role': 'Lure', 'sim': 'HIGH', 'count': 5, 'by': ['valence']},
+               {'role': 'Repeat', 'count': 5, 'by': ['valence']},
+               {'role': 'Foil', 'count': 5, 'by': ['valence']},
+               {'role': 'LureA', 'count': 10, 'by': ['valence']}]}
+FILTER_FIELDS = ['valence', 'role', 'sim', 'arousal']
+
+
+def load_config(fpath=None):
+    """Returns the selection config read from a JSON file, or the default
+    config (the composition of the original sets A, B and C)."""
+    if fpath is None:
+        return dict(DEFAULT_CONFIG)
+    with open(fpath) as f:
+        config = json.load(f)
+    return dict(DEFAULT_CONFIG, **config)
+
+
+def get_set_names(n_sets):
+    if n_sets <= 26:
+        return ['set' + letter for letter in string.ascii_uppercase[:n_sets]]
+    return ['form%02d' % (i + 1) for i in range(n_sets)]
+
+
+def get_pool(pnames):
+    """Classifies a pool of image paths and returns it with the image
+    number (stim, e.g. 10029 for 10029c.jpg) of each. Paths that are not stimuli are dropped."""
+    df = Emo_Manifest.classify_names(pnames)
+    df.insert(0, 'pname', pd.Series(pnames, index=df.index))
+    df = df.loc[df['role'].notna()]
+    df['stim'] = pd.to_numeric(df['file'].str.slice(0, 5)).astype(np.int64)
+    return df
+
+
+def set_groups(df_pool, rows_i, rows_j):
+    """Returns the pool with a group column joining the image numbers of
+    the pairs of pool rows (positions rows_i, rows_j) into connected groups,
+    e.g. near-duplicate images. Image numbers without pairs are their own
+    group."""
+    from scipy.sparse import coo_matrix                 #Only needed to group pools
+    from scipy.sparse.csgraph import connected_components
+    codes, stims = pd.factorize(df_pool['stim'])
+    edges = coo_matrix((np.ones(len(rows_i)), (codes[rows_i], codes[rows_j])), shape=(len(stims), len(stims)))
+    labels = connected_components(edges, directed=False)[1]
+    return df_pool.assign(group=labels[codes].astype(np.int64))
+
+
+def get_candidates(df_pool, quota):
+    """Returns the units a quota can draw from: a frame indexed like the
+    pool rows of its images (lure b-e versions for lure quotas)."""
+    mask = np.ones(len(df_pool), dtype=bool)
+    for field in FILTER_FIELDS:
+        if field not in quota:
+            continue
+        if field == 'role' and quota['role'] == 'Lure':
+            mask &= df_pool['role'].isin(['LureB', 'LureC', 'LureD', 'LureE']).to_numpy()
+        else:
+            mask &= (df_pool[field] == quota[field]).to_numpy()
+    return df_pool.loc[mask]
+
+
+def select_sets(df_pool, config):
+    """Draws the sets of a config from a pool (see get_pool) and returns the
+    selected pool rows with their set name and quota number. Raises a
+    ValueError naming the first stratum without enough candidates."""
+    n_sets = config['sets']
+    names = config.get('names') or get_set_names(n_sets)
+    rng = np.random.default_rng(config['seed'])
+    stims = df_pool['stim'].to_numpy()
+    key = 'group' if 'group' in df_pool else 'stim'
+    keys = df_pool[key].to_numpy()
+    used = np.zeros(keys.max() + 1 if len(keys) else 1, dtype=bool)
+    #Lure versions bring their studied a version along
+    a_rows = np.full(stims.max() + 1 if len(stims) else 1, -1)
+    is_a = (df_pool['role'] == 'LureA').to_numpy()
+    a_rows[stims[is_a][::-1]] = np.flatnonzero(is_a)[::-1]
+    quotas = sorted(enumerate(config['quotas']), key=lambda quota: quota[1].get('role') != 'Lure')
+    selected = []
+    for number, quota in quotas:
+        df = get_candidates(df_pool, quota)
+        keep = ~used[df[key].to_numpy()]
+        if quota.get('role') == 'Lure':
+            keep &= a_rows[df['stim'].to_numpy()] >= 0
+        df = df.loc[keep]
+        by = list(quota.get('by', []))
+        #One random key ranks every candidate; a stim (group) keeps one random version
+        df = df.iloc[np.argsort(rng.random(len(df)), kind='stable')]
+        df = df.loc[~df[key].duplicated().to_numpy()]
+        rank = df.groupby(by, observed=True, sort=False).cumcount().to_numpy() if by else \
+            np.arange(len(df))
+        need = n_sets * quota['count']
+        if by:
+            strata = pd.MultiIndex.from_product([df_pool[field].cat.categories for field in by], names=by)
+            sizes = df.groupby(by, observed=True).size()
+            sizes = sizes.reindex(strata if len(by) > 1 else strata.get_level_values(0), fill_value=0)
+        else:
+            sizes = pd.Series([len(df)], index=['pool'])
+        short = sizes[sizes < need]
+        if len(short):
+            raise ValueError("Quota %d (%s) needs %d units per stratum, %s has %d"
+                             % (number, quota, need, short.index[0], short.iloc[0]))
+        keep = rank < need
+        df = df.loc[keep].copy()
+        df['set'] = pd.Categorical.from_codes(rank[keep] % n_sets, names)
+        df['quota'] = number
+        used[df[key].to_numpy()] = True
+        selected.append(df)
+        if quota.get('role') == 'Lure':
+            df_a = df_pool.iloc[a_rows[df['stim'].to_numpy()]].copy()
+            df_a['set'] = df['set'].to_numpy()
+            df_a['quota'] = number
+            selected.append(df_a)
+    df = pd.concat(selected)
+    return df.sort_values(['set', 'file'])
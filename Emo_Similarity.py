@@ -0,0 +1,439 @@
+'''
+
+*****************************************************************
+Title                           Emo PS Similarity
+Purpose                         Measures how similar each lure is
+                                to its studied image, to check the
+                                LOW/HIGH similarity of the file
+                                names against the image content
+*****************************************************************
+
+Every "a" image is paired with the b-e lures of the same image number in
+its set folder, and each pair is compared on four measures, each scaled
+so 1 is identical:
+
+    phash       1 - Hamming distance / 64 of the DCT perceptual hashes
+    dhash       1 - Hamming distance / 64 of the difference hashes
+    ssim        mean SSIM (7x7 windows) of 64x64 grayscale thumbnails
+    hist        intersection of the 8x8x8 bin RGB colour histograms
+
+score is their mean. A pair is flagged when its label disagrees with the
+image content:
+
+    threshold   on the wrong side of the score threshold that best splits
+                the LOW and HIGH pairs (highest balanced accuracy)
+    inverted    a LOW lure scoring above a HIGH lure of the same target
+                (or the reverse), when a folder holds both
+
+The thumbnails, histograms and hashes of every image are kept in an index
+keyed by the SHA-1 of the image file (as in the set manifests), so only
+new or changed images are decoded again, in a process pool. Images no
+longer in the folders given are dropped from the index. Pairs are
+then compared in vectorized NumPy batches.
+
+    python Emo_Similarity.py stimuli/setA stimuli/setB stimuli/setC -o similarity.csv
+
+hash_files() and find_near_duplicates() find the near-duplicate images of
+a whole library (Emo_files.py --dedup). Only the hashes are kept, in a
+separate index (hashes.npz) keyed by path, size and mtime, so unchanged
+files are not read again. Pairs within a Hamming radius are found with a
+multi-index hash table instead of comparing every pair: the 64 bit
+perceptual hash is split into four 16 bit blocks, and two hashes within
+radius r agree on some block up to r // 4 bits, so only hashes whose
+block values are that close are compared.
+
+'''
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import Emo_Manifest
+import Emo_Resize
+
+INDEX_NAME = 'similarity.npz'
+HASH_INDEX_NAME = 'hashes.npz'
+THUMB_SIZE = 64         #Side of the grayscale thumbnails compared by SSIM
+HASH_SIZE = 8           #Hashes are HASH_SIZE x HASH_SIZE bits
+HIST_BINS = 8           #Bins per RGB channel of the colour histograms
+SSIM_WINDOW = 7
+CHUNK_SIZE = 1024       #Pairs compared per vectorized batch
+BLOCK_BITS = 16         #Bits per block of the multi-index hash table
+MEASURES = ['phash', 'dhash', 'ssim', 'hist']
+PAIR_COLUMNS = ['set', 'target', 'lure', 'sim', 'phash', 'dhash', 'ssim', 'hist', 'score', 'predicted',
+                'flag']
+
+
+def get_index_path(set_dirs):
+    """Returns the default index path, in the derivative store next to the
+    first set folder."""
+    return os.path.join(os.path.dirname(os.path.normpath(set_dirs[0])), Emo_Resize.CACHE_LOC, INDEX_NAME)
+
+
+def extract_features(fpath):
+    """Decodes an image and returns its grayscale thumbnail, the small
+    grayscale image of its difference hash and its colour histogram."""
+    from PIL import Image   #Only needed to decode, not to compare, images
+    with Image.open(fpath) as im:
+        im = im.convert('RGB')
+        thumb = np.asarray(im.convert('L').resize((THUMB_SIZE, THUMB_SIZE), Image.LANCZOS))
+        dgray = np.asarray(im.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS))
+        pixels = np.asarray(im.resize((THUMB_SIZE * 2, THUMB_SIZE * 2), Image.BILINEAR)).reshape(-1, 3)
+    bins = pixels.astype(np.int64) * HIST_BINS // 256
+    codes = (bins[:, 0] * HIST_BINS + bins[:, 1]) * HIST_BINS + bins[:, 2]
+    hist = np.bincount(codes, minlength=HIST_BINS ** 3) / len(codes)
+    return thumb, dgray, hist.astype(np.float32)
+
+
+def get_dct_matrix(n):
+    """Returns the orthonormal DCT-II matrix of size n."""
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def pack_bits(bits):
+    """Packs boolean arrays of shape (images, 64) into uint64 hashes."""
+    weights = np.uint64(1) << np.arange(bits.shape[1], dtype=np.uint64)
+    return (bits.astype(np.uint64) * weights).sum(axis=1, dtype=np.uint64)
+
+
+def get_hashes(thumbs, dgrays):
+    """Returns the perceptual (DCT) and difference hashes of arrays of
+    thumbnails and difference hash images, as uint64 arrays."""
+    small = thumbs.reshape(len(thumbs), 32, THUMB_SIZE // 32, 32, THUMB_SIZE // 32).mean(axis=(2, 4))
+    dct = get_dct_matrix(32)
+    coefs = (dct @ small @ dct.T)[:, :HASH_SIZE, :HASH_SIZE].reshape(len(thumbs), -1)
+    phash = pack_bits(coefs > np.median(coefs[:, 1:], axis=1, keepdims=True))
+    dgrays = dgrays.astype(np.int16)
+    dhash = pack_bits((dgrays[:, :, 1:] > dgrays[:, :, :-1]).reshape(len(dgrays), -1))
+    return phash, dhash
+
+
+def load_index(fpath):
+    """Returns the feature index saved at fpath as a dict of arrays, empty
+    if there is none."""
+    if os.path.isfile(fpath):
+        with np.load(fpath) as saved:
+            return dict((key, saved[key]) for key in saved.files)
+    return {'sha1': np.array([], dtype='U40'),
+            'thumb': np.zeros((0, THUMB_SIZE, THUMB_SIZE), dtype=np.uint8),
+            'dgray': np.zeros((0, HASH_SIZE, HASH_SIZE + 1), dtype=np.uint8),
+            'hist': np.zeros((0, HIST_BINS ** 3), dtype=np.float32),
+            'phash': np.array([], dtype=np.uint64), 'dhash': np.array([], dtype=np.uint64)}
+
+
+def update_index(index, images, jobs=1):
+    """Drops the features of images no longer listed and adds those of the
+    images (sha1 -> path) missing from the index, decoded in a process
+    pool. Returns the index along with the numbers of images decoded and
+    dropped."""
+    keep = np.isin(index['sha1'], list(images))
+    dropped = int((~keep).sum())
+    if dropped:
+        index = dict((key, values[keep]) for key, values in index.items())
+    todo = sorted(set(images) - set(index['sha1'].tolist()))
+    if not todo:
+        return index, 0, dropped
+    paths = [images[sha1] for sha1 in todo]
+    if jobs > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            features = list(pool.map(extract_features, paths, chunksize=16))
+    else:
+        features = [extract_features(fpath) for fpath in paths]
+    thumbs, dgrays, hists = [np.stack(parts) for parts in zip(*features)]
+    phash, dhash = get_hashes(thumbs, dgrays)
+    new = {'sha1': np.array(todo, dtype='U40'), 'thumb': thumbs, 'dgray': dgrays, 'hist': hists,
+           'phash': phash, 'dhash': dhash}
+    return dict((key, np.concatenate([index[key], new[key]])) for key in new), len(todo), dropped
+
+
+def save_index(fpath, index):
+    """Saves the feature index, replacing the file atomically."""
+    folder = os.path.dirname(fpath)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(fpath + '.tmp', 'wb') as f:
+        np.savez(f, **index)
+    os.replace(fpath + '.tmp', fpath)
+
+
+def get_pairs(set_dirs):
+    """Returns every target/lure pair of the set folders as a frame (set,
+    target, lure, sim and the SHA-1 of both images), along with a dict of
+    the paths of the images by SHA-1. The hashes come from the set
+    manifests, which are updated first if their images changed."""
+    rows = []
+    images = {}
+    for set_dir in set_dirs:
+        manifest = Emo_Manifest.load_manifest(set_dir)
+        targets = dict((entry['file'][:5], entry) for entry in manifest['images'] if entry['role'] == 'LureA')
+        for entry in manifest['images']:
+            target = targets.get(entry['file'][:5])
+            if entry['sim'] is None or target is None:
+                continue
+            rows.append((manifest['set'], target['file'], entry['file'], entry['sim'],
+                         target['sha1'], entry['sha1']))
+            images[target['sha1']] = os.path.join(set_dir, target['file'])
+            images[entry['sha1']] = os.path.join(set_dir, entry['file'])
+    df_pairs = pd.DataFrame(rows, columns=['set', 'target', 'lure', 'sim', 'target_sha1', 'lure_sha1'])
+    return df_pairs, images
+
+
+def box_mean(values, size):
+    """Returns the means of every size x size window of a stack of images
+    (valid windows only), from their integral images."""
+    integral = np.pad(values.cumsum(axis=1).cumsum(axis=2), ((0, 0), (1, 0), (1, 0)))
+    sums = (integral[:, size:, size:] - integral[:, :-size, size:] - integral[:, size:, :-size] +
+            integral[:, :-size, :-size])
+    return sums / (size * size)
+
+
+def get_ssim(x, y, size=SSIM_WINDOW):
+    """Returns the mean SSIM of pairs of grayscale images (two stacks of
+    the same shape, 0-255)."""
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    mu_x = box_mean(x, size)
+    mu_y = box_mean(y, size)
+    var_x = box_mean(x * x, size) - mu_x ** 2
+    var_y = box_mean(y * y, size) - mu_y ** 2
+    cov = box_mean(x * y, size) - mu_x * mu_y
+    ssim = ((2 * mu_x * mu_y + c1) * (2 * cov + c2)) / ((mu_x ** 2 + mu_y ** 2 + c1) * (var_x + var_y + c2))
+    return ssim.mean(axis=(1, 2))
+
+
+def count_bits(values):
+    """Returns the number of set bits of each value of a uint64 array."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.astype('<u8').view(np.uint8).reshape(len(values), 8), axis=1).sum(axis=1)
+
+
+def get_sha1(fpath):
+    with open(fpath, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def extract_hashes(fpath):
+    """Decodes an image and returns its perceptual and difference hashes."""
+    thumb, dgray, hist = extract_features(fpath)
+    phash, dhash = get_hashes(thumb[None], dgray[None])
+    return phash[0], dhash[0]
+
+
+def hash_files(fpaths, index_path, jobs=1):
+    """Returns the perceptual hashes of image files (a uint64 array in the
+    order of fpaths) and the number of images decoded. The hash index at
+    index_path is keyed on absolute path, size and mtime, like the parse
+    cache of Emo_Data, so unchanged files are only stat'ed. New or changed
+    files are read for their SHA-1, and their hashes are taken from an
+    entry of the same content (a copy or a renamed file) when there is
+    one. Only images whose content is new are decoded, in a process pool,
+    and entries of files that no longer exist are evicted."""
+    keys = [os.path.abspath(fpath) for fpath in fpaths]
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        stats = [(st.st_size, st.st_mtime_ns) for st in pool.map(os.stat, keys)]
+    index = None
+    if os.path.isfile(index_path):
+        with np.load(index_path) as saved:
+            if 'path' in saved.files:
+                index = dict((key, saved[key]) for key in saved.files)
+    if index is None:
+        index = {'path': np.array([], dtype=str), 'size': np.array([], dtype=np.int64),
+                 'mtime': np.array([], dtype=np.int64), 'sha1': np.array([], dtype='U40'),
+                 'phash': np.array([], dtype=np.uint64), 'dhash': np.array([], dtype=np.uint64)}
+    cached = dict(zip(index['path'].tolist(), zip(index['size'].tolist(), index['mtime'].tolist(),
+                                                  range(len(index['path'])))))
+    rows = np.zeros(len(keys), dtype=np.int64)
+    misses = []
+    for i, (key, stat) in enumerate(zip(keys, stats)):
+        row = cached.get(key)
+        if row is not None and row[:2] == stat:
+            rows[i] = row[2]
+        else:
+            misses.append(i)
+    if not misses:
+        return index['phash'][rows], 0
+    miss_keys = list(dict.fromkeys(keys[i] for i in misses))
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        sha1s = dict(zip(miss_keys, pool.map(get_sha1, miss_keys)))
+    contents = dict((sha1, row) for row, sha1 in enumerate(index['sha1'].tolist()))
+    paths = dict((sha1, key) for key, sha1 in sha1s.items() if sha1 not in contents)
+    todo = sorted(paths)
+    if jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            hashes = list(pool.map(extract_hashes, [paths[sha1] for sha1 in todo], chunksize=16))
+    else:
+        hashes = [extract_hashes(paths[sha1]) for sha1 in todo]
+    new_hashes = dict(zip(todo, hashes))
+    for sha1 in set(sha1s.values()) - set(new_hashes):
+        new_hashes[sha1] = (index['phash'][contents[sha1]], index['dhash'][contents[sha1]])
+    stat_of = dict((keys[i], stats[i]) for i in misses)
+    #Entries of the same paths are replaced, those of deleted files evicted
+    keep = [row for row, key in enumerate(index['path'].tolist())
+            if key not in stat_of and os.path.isfile(key)]
+    phash, dhash = [np.array(parts, dtype=np.uint64).reshape(-1)
+                    for parts in zip(*[new_hashes[sha1s[key]] for key in miss_keys])]
+    index = {'path': np.concatenate([index['path'][keep], np.array(miss_keys)]),
+             'size': np.concatenate([index['size'][keep], [stat_of[key][0] for key in miss_keys]]),
+             'mtime': np.concatenate([index['mtime'][keep], [stat_of[key][1] for key in miss_keys]]),
+             'sha1': np.concatenate([index['sha1'][keep], np.array([sha1s[key] for key in miss_keys],
+                                                                   dtype='U40')]),
+             'phash': np.concatenate([index['phash'][keep], phash]),
+             'dhash': np.concatenate([index['dhash'][keep], dhash])}
+    save_index(index_path, index)
+    rows = pd.Series(np.arange(len(index['path'])), index=index['path'])
+    return index['phash'][rows[keys].to_numpy()], len(todo)
+
+
+def get_block_masks(radius):
+    """Returns every BLOCK_BITS bit mask with at most radius bits set."""
+    masks = [0]
+    for k in range(1, radius + 1):
+        for bits in itertools.combinations(range(BLOCK_BITS), k):
+            masks.append(sum(1 << bit for bit in bits))
+    return np.array(masks, dtype=np.int64)
+
+
+def find_near_duplicates(hashes, radius):
+    """Returns the pairs of hashes within Hamming distance radius as arrays
+    (i, j, distance) of positions i < j, sorted. Each block of the hashes
+    is bucketed once (a counting sort); every hash then looks up the
+    buckets of the block values within radius // 4 bits of its own, and
+    only the hashes in those buckets are compared in full (see the module
+    notes)."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    n = len(hashes)
+    masks = get_block_masks(radius // (64 // BLOCK_BITS))
+    found = []
+    for shift in range(0, 64, BLOCK_BITS):
+        values = ((hashes >> np.uint64(shift)) & np.uint64((1 << BLOCK_BITS) - 1)).astype(np.int64)
+        order = np.argsort(values, kind='stable')
+        sizes = np.bincount(values, minlength=1 << BLOCK_BITS)
+        starts = np.cumsum(sizes) - sizes
+        for mask in masks:
+            #A pair of different block values is found from its lower one only
+            rows = np.arange(n) if mask == 0 else np.flatnonzero(values < (values ^ mask))
+            probe = values[rows] ^ mask
+            low = starts[probe]
+            counts = sizes[probe]
+            total = int(counts.sum())
+            if not total:
+                continue
+            i = np.repeat(rows, counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = order[np.repeat(low, counts) + offsets]
+            i, j = np.minimum(i, j), np.maximum(i, j)
+            keep = i < j
+            i, j = i[keep], j[keep]
+            keep = count_bits(hashes[i] ^ hashes[j]) <= radius
+            found.append(i[keep] * n + j[keep])
+    pairs = np.unique(np.concatenate(found)) if found else np.array([], dtype=np.int64)
+    i, j = pairs // max(n, 1), pairs % max(n, 1)
+    return i, j, count_bits(hashes[i] ^ hashes[j])
+
+
+def compare_pairs(index, target_rows, lure_rows):
+    """Returns the four similarity measures (MEASURES) of pairs of index
+    rows as a dict of arrays."""
+    measures = dict((name, []) for name in MEASURES)
+    for start in range(0, len(target_rows), CHUNK_SIZE):
+        a = target_rows[start:start + CHUNK_SIZE]
+        b = lure_rows[start:start + CHUNK_SIZE]
+        measures['phash'].append(1 - count_bits(index['phash'][a] ^ index['phash'][b]) / HASH_SIZE ** 2)
+        measures['dhash'].append(1 - count_bits(index['dhash'][a] ^ index['dhash'][b]) / HASH_SIZE ** 2)
+        measures['ssim'].append(get_ssim(index['thumb'][a], index['thumb'][b]))
+        measures['hist'].append(np.minimum(index['hist'][a], index['hist'][b]).sum(axis=1))
+    return dict((name, np.concatenate(parts) if parts else np.array([])) for name, parts in measures.items())
+
+
+def get_threshold(score, high):
+    """Returns the score threshold above which pairs are predicted HIGH that
+    best separates the HIGH and LOW pairs (highest balanced accuracy)."""
+    order = np.argsort(score, kind='stable')
+    sorted_high = high[order]
+    n_high = max(sorted_high.sum(), 1)
+    n_low = max((~sorted_high).sum(), 1)
+    #Cut i predicts HIGH for the pairs from sorted position i on
+    low_below = np.concatenate([[0], np.cumsum(~sorted_high)])
+    high_above = n_high - np.concatenate([[0], np.cumsum(sorted_high)])
+    accuracy = (low_below / n_low + high_above / n_high) / 2
+    cut = int(np.argmax(accuracy))
+    if cut == len(score):
+        return np.inf
+    return score[order][cut]
+
+
+def score_pairs(df_pairs, index):
+    """Measures the similarity of every pair and flags the pairs whose
+    label disagrees with the measures (see the module notes). Returns the
+    pairs with PAIR_COLUMNS and the score threshold."""
+    rows = pd.Series(np.arange(len(index['sha1'])), index=index['sha1'])
+    measures = compare_pairs(index, rows[df_pairs['target_sha1']].to_numpy(),
+                             rows[df_pairs['lure_sha1']].to_numpy())
+    df = df_pairs.assign(**measures)
+    df['score'] = df[MEASURES].mean(axis=1)
+    high = (df['sim'] == 'HIGH').to_numpy()
+    threshold = get_threshold(df['score'].to_numpy(), high)
+    df['predicted'] = np.where(df['score'] >= threshold, 'HIGH', 'LOW')
+    low_max = df['score'].where(~high).groupby([df['set'], df['target']]).transform('max')
+    high_min = df['score'].where(high).groupby([df['set'], df['target']]).transform('min')
+    inverted = np.where(high, df['score'] < low_max, df['score'] > high_min)
+    flags = np.where(df['predicted'] != df['sim'], 'threshold', '')
+    flags = np.where(inverted, np.where(flags == '', 'inverted', 'threshold;inverted'), flags)
+    df['flag'] = flags
+    return df.sort_values(['set', 'target', 'lure'])[PAIR_COLUMNS].reset_index(drop=True), threshold
+
+
+def main():
+    try:
+        error_log = "Data Parsed, Error Occured During, Record, Notes" + "\n"
+        error_level = "Reading arguments,"
+        parser = argparse.ArgumentParser(description="Measures the similarity of every lure to its target "
+                                         "image and flags pairs whose LOW/HIGH label disagrees.")
+        parser.add_argument('sets', nargs='+', help="Stimuli set folders")
+        parser.add_argument('-o', '--out', help="CSV file the pairs are written to")
+        parser.add_argument('--index', help="Feature index file (default: %s in the derivative store)"
+                            % INDEX_NAME)
+        parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                            help="Number of worker processes decoding images")
+        args = parser.parse_args()
+        index_path = args.index or get_index_path(args.sets)
+        error_level = "Listing pairs,"
+        df_pairs, images = get_pairs(args.sets)
+        error_level = "Updating feature index," + index_path
+        start = time.perf_counter()
+        index, decoded, dropped = update_index(load_index(index_path), images, args.jobs)
+        if decoded or dropped:
+            save_index(index_path, index)
+        print("%s: %d images decoded, %d from the index, %d dropped in %.2f s" %
+              (index_path, decoded, len(images) - decoded, dropped, time.perf_counter() - start))
+        error_level = "Comparing pairs,"
+        df, threshold = score_pairs(df_pairs, index)
+        print("Score threshold %.3f\n" % threshold)
+        print(df.groupby(['set', 'sim'])[MEASURES + ['score']].mean().round(3).to_string())
+        df_flagged = df.loc[df['flag'] != '']
+        print("\n%d of %d pairs flagged\n" % (len(df_flagged), len(df)))
+        if len(df_flagged):
+            print(df_flagged.round(3).to_string(index=False))
+        if args.out:
+            error_level = "Writing pairs," + args.out
+            df.to_csv(args.out, index=False)
+    except SystemExit:
+        raise
+    except:
+        error_log = error_log + error_level + ',' + str(sys.exc_info()[1]) + '\n'
+        print(error_log)
+
+
+if __name__ == '__main__':
+    main()
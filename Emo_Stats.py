@@ -0,0 +1,217 @@
+'''
+
+*****************************************************************
+Title                           Emo PS Stats
+Purpose                         Repeated measures ANOVA of many
+                                dependent variables in one batch
+*****************************************************************
+
+anova_rm gives the same F, degrees of freedom and p values as
+statsmodels' AnovaRM(...).fit() (balanced data, one observation per
+subject and cell), for every dependent variable at once. The subject x
+cell table is pivoted once into an array of shape (subjects, levels of
+each within factor, variables), and the sums of squares of every effect
+and of its error term (effect x subject) come from marginal means of that
+array, so one pass of NumPy reductions covers all variables.
+
+resample_rm adds resampling inference for a single within factor:
+
+    permutation     levels are shuffled within each subject (a sign flip
+                    of the difference for two levels); p_perm is the share
+                    of resamples with an F at least the observed one
+    bootstrap       subjects are drawn with replacement; percentile CIs
+                    of the partial eta squared and of the difference of
+                    the last and first level means
+
+Every resample only changes the level means (permutations) or the subject
+weights (bootstrap), so each batch is a few matrix products over all
+variables. Resamples are drawn in fixed chunks, each with its own seed
+spawned from the run seed, and chunks are spread over a process pool:
+the results depend on the seed only, not on the number of processes.
+
+'''
+
+import itertools
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+ANOVA_COLUMNS = ['depvar', 'effect', 'F', 'num_df', 'den_df', 'p']
+RESAMPLE_COLUMNS = ['depvar', 'effect', 'F', 'p', 'p_perm', 'eta_p2', 'eta_p2_low', 'eta_p2_high',
+                    'diff', 'diff_low', 'diff_high', 'resamples', 'seed']
+CHUNK_SIZE = 5000       #Resamples drawn per seed and per task of the process pool
+SS_TOLERANCE = 1e-10    #Sums of squares below this share of the total are round-off
+
+
+def get_cell_array(df, depvars, subject, within):
+    """Pivots a long table into an array of shape (subjects, levels of each
+    within factor..., depvars). Raises a ValueError, like AnovaRM, unless
+    every subject has exactly one row per cell."""
+    codes = []
+    levels = []
+    for col in [subject] + list(within):
+        code, level = pd.factorize(df[col], sort=True)
+        codes.append(code)
+        levels.append(level)
+    shape = tuple(len(level) for level in levels)
+    cells = np.ravel_multi_index(codes, shape) if len(df) else np.array([], dtype=np.int64)
+    if len(df) != int(np.prod(shape)) or len(np.unique(cells)) != len(df):
+        raise ValueError('Data is unbalanced.')
+    values = np.empty((int(np.prod(shape)), len(depvars)))
+    values[cells] = df[list(depvars)].to_numpy(dtype=float)
+    return values.reshape(shape + (len(depvars),)), levels
+
+
+def get_sum_squares(values, axes):
+    """Returns the sum of squares of the interaction term of the given axes
+    (main effect for one axis) for every variable (last axis), computed
+    from the marginal means by inclusion-exclusion."""
+    n_axes = values.ndim - 1
+    term = 0
+    for k in range(len(axes) + 1):
+        for subset in itertools.combinations(axes, k):
+            others = tuple(axis for axis in range(n_axes) if axis not in subset)
+            sign = (-1) ** (len(axes) - k)
+            term = term + sign * values.mean(axis=others, keepdims=True)
+    term = np.broadcast_to(term, values.shape)
+    return (term ** 2).sum(axis=tuple(range(n_axes)))
+
+
+def get_f_ratio(ss_effect, ss_error, num_df, den_df, ss_total):
+    """Returns F and the partial eta squared of an effect from its sum of
+    squares and that of its error term. Sums of squares up to SS_TOLERANCE
+    times the total are round-off and taken as 0, so a variable that does
+    not vary with the effect gets F 0, or NaN when its error term does not
+    vary either, rather than a ratio of round-off errors."""
+    floor = SS_TOLERANCE * ss_total
+    ss_effect = np.where(ss_effect <= floor, 0.0, ss_effect)
+    ss_error = np.where(ss_error <= floor, 0.0, ss_error)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        F = (ss_effect / num_df) / (ss_error / den_df)
+        eta = ss_effect / (ss_effect + ss_error)
+    return F, eta
+
+
+def anova_rm(df, depvars, subject, within):
+    """Runs a repeated measures ANOVA of each of depvars on the within
+    factors, and returns a tidy frame with one row per variable and effect
+    (ANOVA_COLUMNS). Effects are named like AnovaRM ('inst', 'a:b')."""
+    values, levels = get_cell_array(df, depvars, subject, within)
+    n_subjects = values.shape[0]
+    cells = tuple(range(values.ndim - 1))
+    ss_total = ((values - values.mean(axis=cells)) ** 2).sum(axis=cells)
+    rows = []
+    for k in range(1, len(within) + 1):
+        for effect in itertools.combinations(range(1, len(within) + 1), k):
+            ss_effect = get_sum_squares(values, effect)
+            ss_error = get_sum_squares(values, (0,) + effect)
+            num_df = int(np.prod([values.shape[axis] - 1 for axis in effect]))
+            den_df = num_df * (n_subjects - 1)
+            F = get_f_ratio(ss_effect, ss_error, num_df, den_df, ss_total)[0]
+            p = stats.f.sf(F, num_df, den_df)
+            name = ':'.join(within[axis - 1] for axis in effect)
+            rows.append(pd.DataFrame({'depvar': list(depvars), 'effect': name, 'F': F,
+                                      'num_df': float(num_df), 'den_df': float(den_df), 'p': p}))
+    df_anova = pd.concat(rows, ignore_index=True)
+    order = pd.Categorical(df_anova['depvar'], categories=list(depvars))
+    return df_anova.iloc[np.argsort(order.codes, kind='stable')].reset_index(drop=True)[ANOVA_COLUMNS]
+
+
+def get_level_options(values):
+    """Returns every within-subject ordering of the levels of an array of
+    shape (subjects, levels, variables), as an array of shape (orderings,
+    subjects, levels * variables)."""
+    orders = list(itertools.permutations(range(values.shape[1])))
+    return np.stack([values[:, list(order), :].reshape(len(values), -1) for order in orders])
+
+
+def get_moments(values):
+    """Returns the sums of squares of a (subjects, levels, variables) array
+    that do not change when levels are shuffled within subjects: total and
+    subject, along with the grand mean."""
+    n, k = values.shape[:2]
+    grand = values.mean(axis=(0, 1))
+    ss_total = ((values - grand) ** 2).sum(axis=(0, 1))
+    ss_subject = k * ((values.mean(axis=1) - grand) ** 2).sum(axis=0)
+    return grand, ss_total, ss_subject
+
+
+def get_f(level_means, grand, ss_total, ss_subject, n):
+    """Returns F and the partial eta squared of a one factor RM ANOVA from
+    level means of shape (..., levels, variables), through get_f_ratio like
+    anova_rm."""
+    k = level_means.shape[-2]
+    ss_effect = n * ((level_means - grand[..., None, :]) ** 2).sum(axis=-2)
+    ss_error = ss_total - ss_subject - ss_effect
+    return get_f_ratio(ss_effect, ss_error, k - 1, (k - 1) * (n - 1), ss_total)
+
+
+def resample_chunk(job):
+    """Draws one chunk of permutations and bootstrap samples and returns
+    (permuted F, bootstrap eta squared, bootstrap level difference), each
+    of shape (resamples, variables)."""
+    values, n_resamples, seed = job
+    rng = np.random.default_rng(seed)
+    n, k, n_vars = values.shape
+    options = get_level_options(values)
+    grand, ss_total, ss_subject = get_moments(values)
+    #Permutations: each subject takes one of the k! orderings of its levels
+    choice = rng.integers(len(options), size=(n_resamples, n))
+    sums = sum((choice == o).astype(float) @ options[o] for o in range(len(options)))
+    F_perm = get_f(sums.reshape(n_resamples, k, n_vars) / n, grand, ss_total, ss_subject, n)[0]
+    #Bootstrap: subjects weighted by how many times they were drawn
+    draws = rng.integers(n, size=(n_resamples, n)) + n * np.arange(n_resamples)[:, None]
+    weights = np.bincount(draws.ravel(), minlength=n_resamples * n).reshape(n_resamples, n).astype(float)
+    flat = values.reshape(n, -1)
+    level_means = (weights @ flat).reshape(n_resamples, k, n_vars) / n
+    grand_b = level_means.mean(axis=1)
+    sq_total = weights @ (values ** 2).sum(axis=1)
+    sq_subject = weights @ (values.mean(axis=1) ** 2)
+    ss_total_b = sq_total - n * k * grand_b ** 2
+    ss_subject_b = k * (sq_subject - n * grand_b ** 2)
+    eta_boot = get_f(level_means, grand_b, ss_total_b, ss_subject_b, n)[1]
+    diff_boot = level_means[:, -1, :] - level_means[:, 0, :]
+    return F_perm, eta_boot, diff_boot
+
+
+def resample_rm(df, depvars, subject, factor, n_resamples=10000, seed=0, jobs=1, alpha=0.05):
+    """Runs permutation and bootstrap inference for the effect of a single
+    within factor on each of depvars (see the module notes), and returns a
+    tidy frame with one row per variable (RESAMPLE_COLUMNS). The CIs are
+    1 - alpha percentile intervals."""
+    values, levels = get_cell_array(df, depvars, subject, [factor])
+    n, k = values.shape[:2]
+    grand, ss_total, ss_subject = get_moments(values)
+    F, eta = get_f(values.mean(axis=0), grand, ss_total, ss_subject, n)
+    sizes = [CHUNK_SIZE] * (n_resamples // CHUNK_SIZE)
+    if n_resamples % CHUNK_SIZE:
+        sizes.append(n_resamples % CHUNK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    chunks = [(values, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+    if jobs > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(resample_chunk, chunks))
+    else:
+        results = [resample_chunk(chunk) for chunk in chunks]
+    F_perm, eta_boot, diff_boot = [np.concatenate(parts) for parts in zip(*results)]
+    with np.errstate(invalid='ignore'):
+        observed = np.where(np.isinf(F), F, F - 1e-12 * np.abs(F))
+        p_perm = (1 + (F_perm >= observed).sum(axis=0)) / (1 + n_resamples)
+    quantiles = [alpha / 2, 1 - alpha / 2]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        eta_ci = np.nanquantile(eta_boot, quantiles, axis=0)
+    diff_ci = np.quantile(diff_boot, quantiles, axis=0)
+    #No inference for an effect without an F (a variable that never varies)
+    degenerate = np.isnan(F)
+    p_perm[degenerate] = np.nan
+    eta_ci[:, degenerate] = np.nan
+    diff_ci[:, degenerate] = np.nan
+    return pd.DataFrame({'depvar': list(depvars), 'effect': factor, 'F': F,
+                         'p': stats.f.sf(F, k - 1, (k - 1) * (n - 1)), 'p_perm': p_perm,
+                         'eta_p2': eta, 'eta_p2_low': eta_ci[0], 'eta_p2_high': eta_ci[1],
+                         'diff': values[:, -1, :].mean(axis=0) - values[:, 0, :].mean(axis=0),
+                         'diff_low': diff_ci[0], 'diff_high': diff_ci[1],
+                         'resamples': n_resamples, 'seed': seed})[RESAMPLE_COLUMNS]
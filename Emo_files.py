@@ -20,71 +20,160 @@ import sys
 import pandas as pd
 import glob
 import shutil
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import Emo_Manifest
+import Emo_Select
+import Emo_Resize
+
+FILE_TYPES = {'LureA': 'Encoding', 'Repeat': 'repeats', 'Foil': 'foils'}
+NEW_SETS = {'set1': 'setA', 'set2': 'setB', 'set3': 'setC'}
+LINK_MODES = ['copy', 'hardlink', 'reflink']
+FICLONE = 0x40049409    #Linux ioctl cloning a file into another (reflink)
 
 
 def main():
     try:
         error_log = "Data Parsed, Error Occured During, Record, Notes" + "\n"
-        error_level = ""
-        tpath = join("/","tmp","yassapublic","Experiments","Closed_Enrollment","Various_Projects","Emotional_PS_Short",
-                "emotional_mdt_a","stimuli")
-        error_level = "Precleaning,remove old folders,"
-        for F in glob.glob(tpath +"/*"):
-            fname = get_file_name(F)
-            if fname in ['setA', 'setB', 'setC']:
-                for ofile in (glob.glob(F +"/*.jpg")):
-                    os.remove(ofile)
+        error_level = "Get Parameters, Run Args Parser,"
+        parser = argparse.ArgumentParser(description="Selects images from sets 1, 2 and 3 and syncs them to "
+                                         "sets A, B and C.")
+        parser.add_argument('-s', default=join("/","tmp","yassapublic","Experiments","Closed_Enrollment",
+                            "Various_Projects","Emotional_PS_Short","emotional_mdt_a","stimuli"),
+                            help="Stimuli folder holding the set folders")
+        parser.add_argument('--link', choices=LINK_MODES, default='copy', help="How selected images are placed "
+                            "in the new sets: full copies, hardlinks or reflinks (falling back to copies)")
+        parser.add_argument('-j', '--jobs', type=int, default=8, help="Number of threads syncing files")
+        parser.add_argument('--config', help="Selection config (JSON) drawing balanced sets from all source "
+                            "folders with Emo_Select, instead of the fixed selection of sets A, B and C")
+        parser.add_argument('--sets', type=int, help="Number of sets to draw (overrides the config)")
+        parser.add_argument('--seed', type=int, help="Seed of the draw (overrides the config)")
+        parser.add_argument('--dedup', type=int, metavar='RADIUS', help="Find near-duplicate images (perceptual "
+                            "hashes at most RADIUS bits apart) and keep them out of different sets and roles; "
+                            "with the fixed selection, list the pairs the new sets hold (use --config to keep "
+                            "them apart)")
+        args = parser.parse_args()
+        tpath = args.s
+        config = None
+        new_sets = set(NEW_SETS.values())
+        if args.config or args.sets or args.seed is not None:
+            error_level = "Get Parameters, Read selection config,"
+            config = Emo_Select.load_config(args.config)
+            if args.sets:
+                config['sets'] = args.sets
+            if args.seed is not None:
+                config['seed'] = args.seed
+            new_sets.update(config.get('names') or Emo_Select.get_set_names(config['sets']))
         error_level = "Building File List, Binding Glob,"
-        df_files = pd.DataFrame(glob.glob(tpath +"/*/*.jpg"))
+        df_files = pd.DataFrame([F for F in glob.glob(tpath +"/*/*.jpg")
+                                 if get_folder_name(F) not in new_sets])
         error_level = "Building File dataframe, Naming columns,"
         df_files.columns = ['pname']
-        error_level = "Building File dataframe, getting filename,"
-        df_files.loc[:, 'fname'] = df_files['pname'].apply(get_file_name)
-        error_level = "Building File dataframe, Naming columns,"
-        df_files.loc[:, 'sfolder'] = df_files['pname'].apply(get_folder_name)
-        error_level = "Building File dataframe, Getting filetype,"
-        df_files.loc[:, 'ftype'] = df_files['fname'].apply(get_file_type)
-        error_level = "Building File dataframe,Getting file subtype,"
-        df_files.loc[:, 'subtype'] = df_files['fname'].apply(get_file_subtype)
+        error_level = "Building File dataframe, Classifying files,"
+        df_files = pd.concat([df_files, get_file_columns(df_files['pname'])], axis=1)
         df_files = df_files.sort_values(by=['sfolder', 'ftype', 'subtype', 'fname'],
                                         ascending=(True, True, True, False))
-        df_files.loc[:,'filecount'] = df_files.groupby(['sfolder', 'ftype' , 'subtype']).cumcount()
-        df_types = df_files.groupby(by=['sfolder', 'ftype', 'subtype']).agg({'filecount': 'max'})
-        df_files.loc[:, 'new_set'] = 0
-        df_files.loc[(df_files['ftype'] == 'foils') & (df_files['subtype'] ==
-                     'F-Neg') & (df_files['filecount'] < 5), 'new_set'] = 1
-        df_files.loc[(df_files['ftype'] == 'foils') & (df_files['subtype'] ==
-                     'F-Neu') & (df_files['filecount'] < 5), 'new_set'] = 1
-        df_files.loc[(df_files['ftype'] == 'foils') & (df_files['subtype'] ==
-                     'F-Pos') & (df_files['filecount'] < 5), 'new_set'] = 1
-        error_level = "Select New Dataset, select repeats"
-        df_files.loc[(df_files['ftype'] == 'repeats') & (df_files['subtype'] ==
-                     'R-Neg') & (df_files['filecount'] < 5), 'new_set'] = 1
-        df_files.loc[(df_files['ftype'] == 'repeats') & (df_files['subtype'] ==
-                     'R-Neu') & (df_files['filecount'] < 5), 'new_set'] = 1
-        df_files.loc[(df_files['ftype'] == 'repeats') & (df_files['subtype'] ==
-                     'R-Pos') & (df_files['filecount'] < 5), 'new_set'] = 1
-        df_files.loc[(df_files['ftype'] == 'lure') & (df_files['filecount'] > 10) &
-                     (df_files['filecount'] < 21), 'new_set'] = 1
-        df_files.loc[(df_files['ftype'] == 'Encoding') & (df_files['filecount'] > 10) &
-                     (df_files['filecount'] < 31), 'new_set'] = 1
-        error_level = "subset image sets, selecting all where new set is true,"
-        df_new_files = df_files.loc[(df_files['new_set'] == 1)]
-        error_level = "subset image sets, using apply to create datasets,"
-        df_new_files.loc[:, 'copied'] = df_new_files['pname'].apply(copy_sets)
-        error_level = "subset image sets, add sim to new set,"
-        df_new_files.loc[:, 'sim'] = df_new_files['fname'].apply(get_sim)
-        df_new_files.loc[:, 'arousal'] = df_new_files['fname'].apply(get_aroused)
+        df_files.loc[:,'filecount'] = df_files.groupby(['sfolder', 'ftype' , 'subtype'], observed=True).cumcount()
+        df_types = df_files.groupby(by=['sfolder', 'ftype', 'subtype'], observed=True).agg({'filecount': 'max'})
+        if config is not None:
+            df_pool = Emo_Select.get_pool(df_files['pname'])
+            if args.dedup is not None:
+                error_level = "Select New Dataset, finding near-duplicate images,"
+                rows_i, rows_j = find_duplicates(df_pool['pname'], df_pool['stim'], args.dedup, tpath, args.jobs)
+                df_pool = Emo_Select.set_groups(df_pool, rows_i, rows_j)
+            error_level = "Select New Dataset, drawing sets from config,"
+            df_selected = Emo_Select.select_sets(df_pool, config)
+            df_new_files = df_files.loc[df_selected.index].copy()
+            df_new_files.loc[:, 'new_set'] = df_selected['set'].astype(str)
+            df_new_files.loc[:, 'dest'] = [join(tpath, new_set, fname) for new_set, fname
+                                           in zip(df_new_files['new_set'], df_new_files['fname'])]
+            print(get_selection_summary(df_selected))
+        else:
+            df_files.loc[:, 'new_set'] = 0
+            df_files.loc[(df_files['ftype'] == 'foils') & (df_files['subtype'] ==
+                         'F-Neg') & (df_files['filecount'] < 5), 'new_set'] = 1
+            df_files.loc[(df_files['ftype'] == 'foils') & (df_files['subtype'] ==
+                         'F-Neu') & (df_files['filecount'] < 5), 'new_set'] = 1
+            df_files.loc[(df_files['ftype'] == 'foils') & (df_files['subtype'] ==
+                         'F-Pos') & (df_files['filecount'] < 5), 'new_set'] = 1
+            error_level = "Select New Dataset, select repeats"
+            df_files.loc[(df_files['ftype'] == 'repeats') & (df_files['subtype'] ==
+                         'R-Neg') & (df_files['filecount'] < 5), 'new_set'] = 1
+            df_files.loc[(df_files['ftype'] == 'repeats') & (df_files['subtype'] ==
+                         'R-Neu') & (df_files['filecount'] < 5), 'new_set'] = 1
+            df_files.loc[(df_files['ftype'] == 'repeats') & (df_files['subtype'] ==
+                         'R-Pos') & (df_files['filecount'] < 5), 'new_set'] = 1
+            df_files.loc[(df_files['ftype'] == 'lure') & (df_files['filecount'] > 10) &
+                         (df_files['filecount'] < 21), 'new_set'] = 1
+            df_files.loc[(df_files['ftype'] == 'Encoding') & (df_files['filecount'] > 10) &
+                         (df_files['filecount'] < 31), 'new_set'] = 1
+            error_level = "subset image sets, selecting all where new set is true,"
+            df_new_files = df_files.loc[(df_files['new_set'] == 1)]
+            error_level = "subset image sets, using apply to create datasets,"
+            df_new_files = df_new_files.copy()
+            df_new_files.loc[:, 'dest'] = df_new_files['pname'].apply(copy_dest)
+            df_new_files = df_new_files.loc[df_new_files['dest'].notna()]
+            if args.dedup is not None:
+                error_level = "Select New Dataset, checking for near-duplicate images,"
+                stims = df_new_files['fname'].astype(str).str.slice(0, 5)
+                rows_i, rows_j = find_duplicates(df_new_files['pname'], stims, args.dedup, tpath, args.jobs)
+                if len(rows_i):
+                    fnames = df_new_files['dest'].map(lambda dest: join(get_folder_name(dest),
+                                                                        get_file_name(dest))).to_numpy()
+                    print("Near-duplicate images in the new sets (use --config to keep them apart):")
+                    for i, j in zip(rows_i, rows_j):
+                        print("    %s ~ %s" % (fnames[i], fnames[j]))
+                        error_log = error_log + "Checking for near-duplicate images," + fnames[i] + ',' + \
+                            fnames[j] + '\n'
+        error_level = "subset image sets, syncing new sets,"
+        start = time.perf_counter()
+        results = sync_sets(df_new_files['pname'], df_new_files['dest'], args.link, args.jobs)
+        elapsed = time.perf_counter() - start
+        df_new_files.loc[:, 'copied'] = [int(result[0] != 'failed') for result in results]
+        print(get_sync_summary(results, elapsed))
+        for F, (status, nbytes, error) in zip(df_new_files['pname'], results):
+            if status == 'failed':
+                error_log = error_log + "Syncing new sets," + F + ',' + error + '\n'
         error_level = "subset image sets, Get new Count of file types including sim,"
-        df_types = df_new_files.groupby(by=['sfolder', 'ftype', 'subtype', 'sim']).agg({'filecount': 'count'})
+        df_types = df_new_files.groupby(by=['sfolder', 'ftype', 'subtype', 'sim'], observed=True).agg({'filecount': 'count'})
+        print("\nNew sets, files by type and similarity\n")
+        print(df_types['filecount'].unstack(fill_value=0).to_string())
         error_level = "subset image sets, Get new Count of file types including arousal,"
-        df_types = df_new_files.groupby(by=['sfolder', 'ftype', 'subtype', 'arousal']).agg({'filecount': 'count'})
-        error_level = "subset image sets, using apply to create datasets,"
+        df_types = df_new_files.groupby(by=['sfolder', 'ftype', 'subtype', 'arousal'], observed=True).agg({'filecount': 'count'})
+        print("\nNew sets, files by type and arousal\n")
+        print(df_types['filecount'].unstack(fill_value=0).to_string())
+        error_level = "subset image sets, writing set manifests,"
+        for set_dir in df_new_files['dest'].apply(path.dirname).unique():
+            Emo_Manifest.write_manifest(set_dir)
     except:
         error_log = error_log + error_level + ',' + str(sys.exc_info()[1]) + '\n'
     print(error_log)
 
 
+def get_selection_summary(df_selected):
+    counts = df_selected.groupby(['set', 'role'], observed=True).size().unstack(fill_value=0)
+    return "Selected %d images in %d sets\n%s" % (len(df_selected), len(counts), counts.to_string())
+
+
+def find_duplicates(pnames, stims, radius, tpath, jobs=8):
+    """Returns the row positions (i, j) of the pairs of near-duplicate
+    images among pnames, whose perceptual hashes are at most radius bits
+    apart (Emo_Similarity), leaving out versions of the same image number
+    (stims). Hashes are kept in the hash index of the stimuli folder."""
+    import Emo_Similarity
+    start = time.perf_counter()
+    index_path = join(tpath, Emo_Resize.CACHE_LOC, Emo_Similarity.HASH_INDEX_NAME)
+    hashes, decoded = Emo_Similarity.hash_files(list(pnames), index_path, jobs)
+    rows_i, rows_j, distances = Emo_Similarity.find_near_duplicates(hashes, radius)
+    stims = pd.Series(stims).to_numpy()
+    keep = stims[rows_i] != stims[rows_j]
+    print("Near-duplicates within %d bits: %d pairs among %d images (%d hashed) in %.2f s"
+          % (radius, keep.sum(), len(hashes), decoded, time.perf_counter() - start))
+    return rows_i[keep], rows_j[keep]
+
+
 def get_file_name(pname):
     parts = pname.split('/')
     end = len(parts)-1
@@ -99,102 +188,123 @@ def get_folder_name(pname):
     return sfolder
 
 
-def get_file_type(fname):
-    fname = fname.replace('.jpg','')
-    if 'a' in fname:
-        ftype = 'Encoding'
-    elif ('b' in fname) or ('c' in fname) or ('d' in fname) or ('e' in fname):
-        ftype = 'lure'
-    elif fname[0] in ["4", "5", "6"]:
-        ftype = "repeats"
-    elif fname[0] in ["7", "8", "9"]:
-        ftype = 'foils'
-    return ftype
-
-
-def get_file_type(fname):
-    fname = fname.replace('.jpg', '')
-    if 'a' in fname:
-        ftype = 'Encoding'
-    elif ('b' in fname) or ('c' in fname) or ('d' in fname) or ('e' in fname):
-        ftype = 'lure'
-    elif fname[0] in ["4", "5", "6"]:
-        ftype = "repeats"
-    elif fname[0] in ["7", "8", "9"]:
-        ftype = 'foils'
-    return ftype
-
-
-def get_file_subtype(fname):
-    if fname[0] == "1":
-        subtype = 'Neg-Lure'
-    elif fname[0] == "2":
-        subtype = 'Neut-Lure'
-    elif fname[0] == "3":
-        subtype = 'Pos-Lure'
-    elif fname[0] == "4":
-        subtype = 'R-Neg'
-    elif fname[0] == "5":
-        subtype = 'R-Neu'
-    elif fname[0] == "6":
-        subtype = 'R-Pos'
-    elif fname[0] == '7':
-        subtype = "F-Neg"
-    elif fname[0] == '8':
-        subtype = "F-Neu"
-    elif fname[0] == '9':
-        subtype = "F-Pos"
-    else:
-        subtype = "lure"
-    return subtype
-
-def get_sim(fname):
-    fname = fname.replace('.jpg', '')
-    if ('b' in fname) or ('d' in fname):
-        sim = 'LOW'
-    elif ('c' in fname) or ('e' in fname):
-        sim = 'HIGH'
-    else:
-        sim = 'not'
-    return sim
-
-
-def copy_sets(fpath):
+def get_file_columns(pnames):
+    """Classifies every file path in one pass (Emo_Manifest.classify_names)
+    and returns the fname, sfolder, ftype, subtype, sim and arousal columns
+    of the file dataframe, as categoricals."""
+    df = Emo_Manifest.classify_names(pnames, {'ftype': get_file_type, 'subtype': get_file_subtype,
+                                              'lure_sim': get_sim})
+    bad = df['role'].isna()
+    if bad.any():
+        raise ValueError("Not a stimulus file name: " + str(pnames[bad].iloc[0]))
+    df = df.rename(columns={'file': 'fname', 'folder': 'sfolder'})
+    df['sim'] = df.pop('lure_sim')
+    return df[['fname', 'sfolder', 'ftype', 'subtype', 'sim', 'arousal']]
+
+
+def get_file_type(coding):
+    return FILE_TYPES.get(coding['role'], 'lure')
+
+
+def get_file_subtype(coding):
+    if coding['role'].startswith('Lure'):
+        return coding['valence'].replace('Neu', 'Neut') + '-Lure'
+    return coding['trial_type']
+
+
+def get_sim(coding):
+    return coding['sim'] or 'not'
+
+
+def copy_dest(fpath):
+    sfolder = get_folder_name(fpath)
+    if sfolder not in NEW_SETS:
+        return None
+    return join(path.dirname(path.dirname(fpath)), NEW_SETS[sfolder], get_file_name(fpath))
+
+
+def get_hash(fpath):
+    sha1 = hashlib.sha1()
+    with open(fpath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def is_synced(src, dest):
+    """True if dest already holds the content of src: the same file (a
+    hardlink), or a file of the same size and content hash."""
+    if not path.isfile(dest):
+        return False
+    if path.samefile(src, dest):
+        return True
+    if path.getsize(src) != path.getsize(dest):
+        return False
+    return get_hash(src) == get_hash(dest)
+
+
+def place_file(src, dest, link):
+    """Places src at dest as a hardlink, a reflink or a copy, falling back
+    to a copy where links are not supported (e.g. across file systems)."""
+    tmp = dest + '.tmp'
+    if path.lexists(tmp):
+        os.remove(tmp)
     try:
-        if 'set1' in fpath:
-            dest = fpath.replace('set1', 'setA')
-        elif 'set2' in fpath:
-            dest = fpath.replace('set2', 'setB')
-        elif 'set3' in fpath:
-            dest = fpath.replace('set3', 'setC')
-        shutil.copyfile(fpath, dest, follow_symlinks=True)
-        return 1
-    except:
-        return 0
-
-
-def get_aroused(fname):
-    fname = fname.replace('.jpg', '')
-    if 'a' in fname:
-        fname = fname.replace('a', '')
-    elif 'b' in fname:
-        fname = fname.replace('b', '')
-    elif 'c' in fname:
-        fname = fname.replace('c', '')
-    elif 'd' in fname:
-        fname = fname.replace('d', '')
-    elif 'e' in fname:
-        fname = fname.replace('e', '')
-    fact = int(fname[0])
-    num = int(fname)
-    result = num - fact*10000
-    if result <= 25:
-        arousal = 'LOW'
-    elif result > 25:
-        arousal = "HIGH"
-    else:
-        arousal = 'none'
-    return arousal
+        if link == 'hardlink':
+            os.link(src, tmp)
+        elif link == 'reflink':
+            import fcntl
+            with open(src, 'rb') as fsrc, open(tmp, 'wb') as fdest:
+                fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+        else:
+            shutil.copyfile(src, tmp)
+    except (OSError, ImportError):
+        if path.lexists(tmp):
+            os.remove(tmp)
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+def sync_file(job):
+    """Syncs one file and returns (status, bytes, error) where status is
+    copied, skipped or failed."""
+    src, dest, link = job
+    try:
+        if is_synced(src, dest):
+            return 'skipped', 0, ''
+        place_file(src, dest, link)
+        return 'copied', path.getsize(dest), ''
+    except Exception:
+        return 'failed', 0, str(sys.exc_info()[1])
+
+
+def sync_sets(sources, dests, link='copy', jobs=8):
+    """Makes the destination set folders hold exactly the selected files:
+    images no longer selected are removed, and only files whose content
+    differs are copied (or linked), on a thread pool. Returns the
+    (status, bytes, error) of every file, in order."""
+    dests = list(dests)
+    selected = set(path.normpath(dest) for dest in dests)
+    for set_dir in set(path.dirname(dest) for dest in dests):
+        if not path.isdir(set_dir):
+            os.makedirs(set_dir)
+        for ofile in glob.glob(join(set_dir, "*.jpg")):
+            if path.normpath(ofile) not in selected:
+                os.remove(ofile)
+    jobs_list = [(src, dest, link) for src, dest in zip(sources, dests)]
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(pool.map(sync_file, jobs_list))
+
+
+def get_sync_summary(results, elapsed):
+    counts = dict((status, 0) for status in ['copied', 'skipped', 'failed'])
+    nbytes = 0
+    for status, size, error in results:
+        counts[status] += 1
+        nbytes += size
+    return ("Synced %d files in %.2f s: %d copied, %d skipped, %d failed (%.1f MB, %.1f MB/s)"
+            % (len(results), elapsed, counts['copied'], counts['skipped'], counts['failed'],
+               nbytes / 1048576, nbytes / 1048576 / max(elapsed, 1e-9)))
 
 
 if __name__ == '__main__':
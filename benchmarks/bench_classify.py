@@ -0,0 +1,113 @@
+'''
+
+Benchmark of the file classification stage of Emo_files.py
+
+usage           : python benchmarks/bench_classify.py [--sizes 10000,100000,1000000]
+
+Classifies N synthetic stimulus paths (sets 1-3, all valences, roles and
+lure letters, image numbers 1-9999) with Emo_files.get_file_columns, the
+single regex pass, for increasing N. For comparison, the old per-row
+.apply stage is timed on the smaller sizes; its functions are copied
+below as they were.
+
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import Emo_files
+
+
+def make_paths(n, seed=0):
+    rng = random.Random(seed)
+    paths = []
+    for i in range(n):
+        digit = rng.randint(1, 9)
+        letter = rng.choice('abcde') if digit <= 3 else ''
+        paths.append('/library/stimuli/set%d/%d%04d%s.jpg' % (rng.randint(1, 3), digit,
+                                                            rng.randint(1, 9999), letter))
+    return pd.Series(paths)
+
+
+def legacy_file_type(fname):
+    fname = fname.replace('.jpg', '')
+    if 'a' in fname:
+        ftype = 'Encoding'
+    elif ('b' in fname) or ('c' in fname) or ('d' in fname) or ('e' in fname):
+        ftype = 'lure'
+    elif fname[0] in ["4", "5", "6"]:
+        ftype = "repeats"
+    elif fname[0] in ["7", "8", "9"]:
+        ftype = 'foils'
+    return ftype
+
+
+def legacy_file_subtype(fname):
+    subtypes = {'1': 'Neg-Lure', '2': 'Neut-Lure', '3': 'Pos-Lure', '4': 'R-Neg', '5': 'R-Neu',
+                '6': 'R-Pos', '7': 'F-Neg', '8': 'F-Neu', '9': 'F-Pos'}
+    return subtypes.get(fname[0], 'lure')
+
+
+def legacy_sim(fname):
+    fname = fname.replace('.jpg', '')
+    if ('b' in fname) or ('d' in fname):
+        sim = 'LOW'
+    elif ('c' in fname) or ('e' in fname):
+        sim = 'HIGH'
+    else:
+        sim = 'not'
+    return sim
+
+
+def legacy_aroused(fname):
+    fname = fname.replace('.jpg', '')
+    for letter in 'abcde':
+        if letter in fname:
+            fname = fname.replace(letter, '')
+            break
+    result = int(fname) - int(fname[0]) * 10000
+    return 'LOW' if result <= 25 else 'HIGH'
+
+
+def classify_legacy(pnames):
+    df = pd.DataFrame({'pname': pnames})
+    df.loc[:, 'fname'] = df['pname'].apply(Emo_files.get_file_name)
+    df.loc[:, 'sfolder'] = df['pname'].apply(Emo_files.get_folder_name)
+    df.loc[:, 'ftype'] = df['fname'].apply(legacy_file_type)
+    df.loc[:, 'subtype'] = df['fname'].apply(legacy_file_subtype)
+    df.loc[:, 'sim'] = df['fname'].apply(legacy_sim)
+    df.loc[:, 'arousal'] = df['fname'].apply(legacy_aroused)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--legacy-max', type=int, default=100000,
+                        help="Largest size to time the legacy per-row stage on")
+    args = parser.parse_args()
+
+    print("%10s %12s %14s %14s" % ('files', 'seconds', 'ns/file', 'legacy ns/file'))
+    for n in [int(size) for size in args.sizes.split(',')]:
+        pnames = make_paths(n)
+        start = time.perf_counter()
+        df = Emo_files.get_file_columns(pnames)
+        elapsed = time.perf_counter() - start
+        legacy = ''
+        if n <= args.legacy_max:
+            start = time.perf_counter()
+            df_legacy = classify_legacy(pnames)
+            legacy = '%.0f' % ((time.perf_counter() - start) / n * 1e9)
+            for col in ['fname', 'sfolder', 'ftype', 'subtype', 'sim', 'arousal']:
+                assert (df[col].astype(str) == df_legacy[col]).all(), col
+        print("%10d %12.3f %14.0f %14s" % (n, elapsed, elapsed / n * 1e9, legacy))
+
+
+if __name__ == '__main__':
+    main()
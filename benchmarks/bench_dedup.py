@@ -0,0 +1,65 @@
+'''
+
+Benchmark of the near-duplicate search of Emo_files.py --dedup
+
+usage           : python benchmarks/bench_dedup.py [--sizes 10000,100000,1000000] [--radius 6]
+
+Draws N random 64 bit perceptual hashes, plants N / 100 near-duplicates
+(copies of random hashes with up to radius bits flipped) and times
+Emo_Similarity.find_near_duplicates, the multi-index hash table search,
+for increasing N. On the sizes up to --check-max, the pairs found are
+checked against comparing every pair.
+
+'''
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import Emo_Similarity
+
+
+def make_hashes(n, radius, seed=0):
+    rng = np.random.default_rng(seed)
+    hashes = rng.integers(0, 2 ** 64, n, dtype=np.uint64)
+    n_planted = max(1, n // 100)
+    copies = hashes[rng.integers(0, n, n_planted)]
+    for k in range(n_planted):
+        for bit in rng.choice(64, rng.integers(0, radius + 1), replace=False):
+            copies[k] ^= np.uint64(1) << np.uint64(bit)
+    hashes[rng.integers(0, n, n_planted)] = copies
+    return hashes
+
+
+def find_all_pairs(hashes, radius):
+    i, j = np.triu_indices(len(hashes), 1)
+    keep = Emo_Similarity.count_bits(hashes[i] ^ hashes[j]) <= radius
+    return i[keep], j[keep]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--radius', type=int, default=6)
+    parser.add_argument('--check-max', type=int, default=5000,
+                        help="Largest size to check against comparing every pair")
+    args = parser.parse_args()
+
+    print("%10s %10s %12s %14s" % ('hashes', 'pairs', 'seconds', 'all pairs'))
+    for n in [int(size) for size in args.sizes.split(',')]:
+        hashes = make_hashes(n, args.radius)
+        start = time.perf_counter()
+        i, j, distances = Emo_Similarity.find_near_duplicates(hashes, args.radius)
+        elapsed = time.perf_counter() - start
+        if n <= args.check_max:
+            all_i, all_j = find_all_pairs(hashes, args.radius)
+            assert (i == all_i).all() and (j == all_j).all()
+        print("%10d %10d %12.3f %14d" % (n, len(i), elapsed, n * (n - 1) // 2))
+
+
+if __name__ == '__main__':
+    main()
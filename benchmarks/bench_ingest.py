@@ -0,0 +1,116 @@
+'''
+
+Benchmark of the log ingestion stage of Emo_Data.py
+
+usage           : python benchmarks/bench_ingest.py [--sizes 1000,10000] [--source logs] [-j 1]
+
+Places N copies of the logs in --source (hardlinks where possible) in a
+temporary folder, with distinct subject IDs, and times the shipped
+ingestion code on them, for increasing N:
+
+    parse           Emo_Data.ingest_logs without a cache, plus building
+                    the report frame once from the records
+    cold cache      the same through the parse cache (read_cached), on
+                    an empty cache
+    warm cache      again, with every log in the cache
+
+For comparison, the old one-row-frame-per-log accumulation (parse_log
+per file, pd.concat standing in for the removed DataFrame.append) is
+timed on the smaller sizes. Linear scaling shows as a constant time per
+log. The sample log in logs/ has no trial tables; for a realistic
+payload, point --source at simulated sessions, e.g. from
+python emomdt_headless.py -n 10 --log-dir /tmp/simlogs
+
+'''
+
+import io
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import Emo_Data
+
+
+def make_logs(templates, n, folder):
+    """Places n copies of the template logs in folder, named with IDs
+    0..n-1 and the set of their template, and returns their paths."""
+    files = []
+    for i in range(n):
+        template = templates[i % len(templates)]
+        Set = Emo_Data.record_id(template)[1]
+        fpath = os.path.join(folder, '%d_%s_log.txt' % (i, Set))
+        try:
+            os.link(template, fpath)
+        except OSError:
+            shutil.copyfile(template, fpath)
+        files.append(fpath)
+    return files
+
+
+def ingest(files, jobs, cache=None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        records = Emo_Data.ingest_logs(files, jobs, cache)[0]
+    return pd.DataFrame.from_records(records, columns=Emo_Data.RPT_HEADERS)
+
+
+def ingest_legacy(files):
+    df_rpt = None
+    for F in files:
+        record = Emo_Data.parse_log(F)[0]
+        if record is None:
+            continue
+        df_row = pd.DataFrame([record + (Emo_Data.get_file_name(F),)], columns=Emo_Data.RPT_HEADERS)
+        df_rpt = df_row if df_rpt is None else pd.concat([df_rpt, df_row])
+    return df_rpt
+
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000,10000')
+    parser.add_argument('--source', default=os.path.join(ROOT, 'logs'), help="Folder of the template logs")
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--legacy-max', type=int, default=10000,
+                        help="Largest size to time the legacy accumulation on")
+    args = parser.parse_args()
+    templates = sorted(glob.glob(os.path.join(args.source, '*.txt')))
+    if not templates:
+        sys.exit("No logs in %s" % args.source)
+
+    print("%d template logs, %.0f bytes on average\n" %
+          (len(templates), sum(os.path.getsize(F) for F in templates) / len(templates)))
+    print("%10s %14s %14s %14s %14s" % ('logs', 'parse us/log', 'cold us/log', 'warm us/log', 'legacy us/log'))
+    for n in [int(size) for size in args.sizes.split(',')]:
+        folder = tempfile.mkdtemp()
+        try:
+            files = make_logs(templates, n, folder)
+            cache = os.path.join(folder, Emo_Data.CACHE_NAME)
+            df, parse = time_call(ingest, files, args.jobs)
+            expected = len(df)
+            df, cold = time_call(ingest, files, args.jobs, cache)
+            assert len(df) == expected
+            df, warm = time_call(ingest, files, args.jobs, cache)
+            assert len(df) == expected
+            legacy = ''
+            if n <= args.legacy_max:
+                legacy = '%.1f' % (time_call(ingest_legacy, files)[1] / n * 1e6)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+        print("%10d %14.1f %14.1f %14.1f %14s" % (n, parse / n * 1e6, cold / n * 1e6, warm / n * 1e6, legacy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''
+
+Benchmark of the set selection engine (Emo_Select.py)
+
+usage           : python benchmarks/bench_select.py [--numbers 9999] [--sets 3,12,48]
+
+Builds a synthetic pool with every image number 1..N of every valence
+digit, lures with all five versions a-e (about 11 N images), classifies
+it once with Emo_Select.get_pool, and times select_sets drawing balanced
+parallel forms with the default quotas, for increasing numbers of sets.
+Each draw is checked for balance and exclusivity.
+
+'''
+
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import Emo_Select
+
+
+def make_paths(n_numbers):
+    paths = []
+    for digit in range(1, 10):
+        letters = 'abcde' if digit <= 3 else ['']
+        for number in range(1, n_numbers + 1):
+            for letter in letters:
+                paths.append('/library/pool/%d%04d%s.jpg' % (digit, number, letter))
+    return pd.Series(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--numbers', type=int, default=9999, help="Image numbers per valence digit")
+    parser.add_argument('--sets', default='3,12,48')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df_pool = Emo_Select.get_pool(make_paths(args.numbers))
+    print("Pool of %d images classified in %.3f s" % (len(df_pool), time.perf_counter() - start))
+    print("%6s %10s %12s" % ('sets', 'images', 'seconds'))
+    for n_sets in [int(size) for size in args.sets.split(',')]:
+        config = dict(Emo_Select.DEFAULT_CONFIG, sets=n_sets)
+        start = time.perf_counter()
+        df = Emo_Select.select_sets(df_pool, config)
+        elapsed = time.perf_counter() - start
+        assert df['stim'].nunique() == df['file'].str.slice(0, 5).nunique()
+        assert not df.drop_duplicates(['stim', 'set'])['stim'].duplicated().any()
+        assert df.groupby('set', observed=True).size().nunique() == 1
+        print("%6d %10d %12.3f" % (n_sets, len(df), elapsed))
+
+
+if __name__ == '__main__':
+    main()
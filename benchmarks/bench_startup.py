@@ -0,0 +1,127 @@
+'''
+
+Benchmark of the start of a task session (emomdt.py and the emodt package)
+
+usage           : python benchmarks/bench_startup.py [--repeats 5] [--set A]
+
+Times, in fresh interpreters started from the repository root:
+
+    launch to dialog        from starting python to the session dialog
+                            being shown by emomdt.AskSession
+    dialog to first frame   from the dialog being answered to the flip of
+                            the first study image: window, refresh rate
+                            measurement, manifest, preloading and the
+                            instruction screen (answered at once)
+
+Each stage runs in its own child process (this script with --child), so
+nothing is imported ahead of time. The child stops at the measured event
+and reports the time and which heavy modules were loaded by then. Needs
+psychopy and a display, like the task itself.
+
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['psychopy', 'PIL', 'numpy', 'pandas', 'pyarrow']
+
+
+class StopSession(Exception):
+    pass
+
+
+def get_loaded():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def child_dialog(start):
+    """Runs the launcher up to the session dialog and reports when it is
+    shown, instead of waiting for an answer."""
+    sys.path.insert(0, ROOT)
+    import emomdt
+    loaded = get_loaded()
+    from psychopy import gui
+
+    class BenchDlg(gui.Dlg):
+        def show(self):
+            raise StopSession(time.time())
+
+    gui.Dlg = BenchDlg
+    try:
+        emomdt.AskSession()
+    except StopSession as stop:
+        return {'seconds': stop.args[0] - start, 'after_import': loaded, 'at_event': get_loaded()}
+
+
+def child_frame(img_set):
+    """Runs a session from the answered dialog to the first stimulus frame,
+    answering every instruction screen at once."""
+    sys.path.insert(0, ROOT)
+    import emomdt
+    log_dir = tempfile.mkdtemp()
+
+    class BenchEmoDT(emomdt.EmoDT):
+        quiet = True
+
+        def WaitKeys(self, keyList):
+            return 'space'
+
+        def ShowFrame(self, stim, keyPresses):
+            emomdt.EmoDT.ShowFrame(self, stim, keyPresses)
+            raise StopSession(time.time())
+
+    start = time.time()
+    task = BenchEmoDT(999, log_dir, emomdt.setDict[img_set], emomdt.TD_STUDY, emomdt.TD_TEST,
+                      emomdt.ITI, emomdt.IMG_FILL)
+    try:
+        task.RunTask()
+    except StopSession as stop:
+        result = {'seconds': stop.args[0] - start, 'at_event': get_loaded()}
+    task.stimCache.close()
+    task.window.close()
+    task.log.close()
+    shutil.rmtree(log_dir, ignore_errors=True)
+    return result
+
+
+def run_child(stage, img_set):
+    start = time.time()
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', stage,
+                                      '--start', repr(start), '--set', img_set], cwd=ROOT)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--set', default='A', help="Stimuli set of the session")
+    parser.add_argument('--child', choices=['dialog', 'frame'], help=argparse.SUPPRESS)
+    parser.add_argument('--start', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == 'dialog':
+        print(json.dumps(child_dialog(args.start)))
+        return
+    if args.child == 'frame':
+        print(json.dumps(child_frame(args.set)))
+        return
+
+    print("%-24s %10s %10s %10s  %s" % ('stage', 'min s', 'median s', 'max s', 'modules loaded'))
+    for stage, label in [('dialog', 'launch to dialog'), ('frame', 'dialog to first frame')]:
+        results = [run_child(stage, args.set) for i in range(args.repeats)]
+        seconds = sorted(result['seconds'] for result in results)
+        print("%-24s %10.3f %10.3f %10.3f  %s" % (label, seconds[0], seconds[len(seconds) // 2],
+                                                  seconds[-1], ','.join(results[-1]['at_event'])))
+        if stage == 'dialog':
+            print("%-24s %s" % ('  after import emomdt', ','.join(results[-1]['after_import']) or 'none'))
+
+
+if __name__ == '__main__':
+    main()
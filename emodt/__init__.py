@@ -0,0 +1,23 @@
+'''
+
+The Emotional Discrimination Task as an importable package. Importing it
+only loads the task classes and settings: psychopy and PIL are imported
+when a session opens its window and loads its images, so the classes can
+be used by other scripts (simulations, recovery, benchmarks) without
+starting a session. emomdt.py is the launcher that runs a session.
+
+    config      settings and folders
+    log         SessionLog, the logfile written on a background thread
+    timing      TimingBuffer and SessionTiming (--timing)
+    cache       StimCache, the stimulus cache with prefetch
+    task        EmoDT and RecoveredEmoDT
+
+'''
+
+from emodt.config import (STIMULI_LOC, SET_A_LOC, SET_B_LOC, SET_C_LOC, LOG_LOC, TD_STUDY, TD_TEST,
+                          ITI, IMG_FILL, FRAME_RATE, LOG_QUEUE, LOG_SYNC, TIMING_SIZE, DROP_FACTOR,
+                          STIM_BUDGET, PREFETCH, workingDir, logDir, setDict)
+from emodt.log import SessionLog
+from emodt.timing import TimingBuffer, SessionTiming
+from emodt.cache import StimCache
+from emodt.task import EmoDT, RecoveredEmoDT
@@ -0,0 +1,102 @@
+'''
+
+Stimulus cache of EmoDT sessions, with LRU eviction under a memory budget
+and background prefetch of the upcoming images.
+
+'''
+
+import time, collections
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StimCache(object):
+    """Bounded cache of ready-to-draw stimuli keyed by image file name.
+    Stimuli are kept in least recently used order and evicted once their
+    decoded size goes over the memory budget. Prefetch() decodes the next
+    images of the trial order on a background thread, so that an image is
+    decoded while the previous trials are on screen; the stimulus itself is
+    created on the main thread by Fetch(), since the window's OpenGL context
+    belongs to it.
+
+    Args:
+        -decode: function decoding an image, returning (im, nBytes)
+        -upload: function creating the stimulus of a decoded image
+        -budget: memory budget, in bytes
+        -prefetch: number of upcoming images decoded ahead
+        -timing: SessionTiming the decode and upload times are added to
+    """
+
+    def __init__(self, decode, upload, budget, prefetch, timing=None):
+        self.decode = decode
+        self.upload = upload
+        self.budget = budget
+        self.prefetch = prefetch
+        self.timing = timing
+        self.stims = collections.OrderedDict()
+        self.nBytes = 0
+        self.pending = {}
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.ResetCounts()
+
+    def ResetCounts(self):
+        """Resets the counts of stimuli found cached, prefetched or decoded
+        on the spot by Fetch(), and of evicted stimuli.
+        """
+        self.nReady = 0
+        self.nPrefetched = 0
+        self.nMissed = 0
+        self.nEvicted = 0
+
+    def Decode(self, img):
+        """Decodes an image, returning the decoded image, its size and the
+        time taken.
+        """
+        start = time.perf_counter()
+        (im, nBytes) = self.decode(img)
+        return im, nBytes, time.perf_counter() - start
+
+    def Prefetch(self, imgs):
+        """Starts decoding those of the first images of imgs (the upcoming
+        trials) that are neither cached nor already being decoded.
+        """
+        for img in imgs[:self.prefetch]:
+            if ((img not in self.stims) and (img not in self.pending)):
+                self.pending[img] = self.executor.submit(self.Decode, img)
+
+    def Fetch(self, img):
+        """Returns the stimulus of an image, creating it from its prefetched
+        decode, or decoding it on the spot if it was not prefetched.
+        """
+        if (img in self.stims):
+            self.stims.move_to_end(img)
+            self.nReady += 1
+            return self.stims[img][0]
+        future = self.pending.pop(img, None)
+        if (future is not None):
+            (im, nBytes, decodeTime) = future.result()
+            self.nPrefetched += 1
+        else:
+            (im, nBytes, decodeTime) = self.Decode(img)
+            self.nMissed += 1
+        start = time.perf_counter()
+        stim = self.upload(img, im)
+        if (self.timing):
+            self.timing.timers["load"].Add(decodeTime,
+                                           time.perf_counter() - start)
+        self.Put(img, stim, nBytes)
+        return stim
+
+    def Put(self, img, stim, nBytes):
+        """Adds a stimulus, evicting the least recently used ones while the
+        cache is over its budget.
+        """
+        self.stims[img] = (stim, nBytes)
+        self.nBytes += nBytes
+        while ((self.nBytes > self.budget) and (len(self.stims) > 1)):
+            (oldImg, (oldStim, oldBytes)) = self.stims.popitem(last=False)
+            self.nBytes -= oldBytes
+            self.nEvicted += 1
+
+    def close(self):
+        """Waits for the prefetch thread to finish."""
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,37 @@
+'''
+
+Settings of the Emotional Discrimination Task: trial timing, display
+fill, buffers of the logs, timings and stimulus cache, and the folders
+of the logs and stimuli sets (relative to the working directory).
+
+'''
+
+import os
+
+workingDir = os.getcwd()
+
+### Variable configuration ###
+STIMULI_LOC = 'stimuli'
+SET_A_LOC = 'setA'
+SET_B_LOC = 'setB'
+SET_C_LOC = 'setC'
+LOG_LOC = 'logs'
+TD_STUDY = 2.5      #Trial duration for study trials
+TD_TEST = 2.5       #Trial duration for test trials
+ITI = 0.5
+IMG_FILL = 0.8
+FRAME_RATE = 60     #Fallback refresh rate if it cannot be measured
+LOG_QUEUE = 1000    #Maximum number of log records waiting to be written
+LOG_SYNC = 1.0      #Seconds between flushes of the logfiles to disk
+TIMING_SIZE = 65536 #Samples kept per timing buffer (18 min of frames at 60 Hz)
+DROP_FACTOR = 1.5   #Flip intervals over this many frames count as dropped
+STIM_BUDGET = 512   #Memory budget of the stimulus cache, in MB of pixels
+PREFETCH = 3        #Upcoming images decoded ahead on the prefetch thread
+
+#Directory setup
+logDir = os.path.join(workingDir, LOG_LOC)
+setADir = os.path.join(workingDir, STIMULI_LOC, SET_A_LOC)
+setBDir = os.path.join(workingDir, STIMULI_LOC, SET_B_LOC)
+setCDir = os.path.join(workingDir, STIMULI_LOC, SET_C_LOC)
+
+setDict = {'A': setADir, 'B': setBDir, 'C': setCDir}
@@ -0,0 +1,133 @@
+'''
+
+Logfiles of EmoDT sessions, written on a background thread.
+
+'''
+
+import os, time, json, threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from emodt.config import LOG_QUEUE, LOG_SYNC
+
+
+class SessionLog(object):
+    """Logfile of a session, written on a background thread. Writes are put
+    on a bounded queue and return immediately, so the trial loop never waits
+    on the disk. The writer thread writes the human-readable logfile along
+    with a JSON lines sidecar holding every record, and flushes and fsyncs
+    both files in batches, every LOG_SYNC seconds and when the log is
+    closed. The sidecar is used to rebuild the logfile of a session that
+    was interrupted (see RecoveredEmoDT).
+    """
+
+    columns = {"Study": ["TrialNum", "Image", "TrialType", "Keypress", "RT",
+                         "Onset", "Offset", "AllKeys"],
+               "Test": ["TrialNum", "Image", "TrialType", "Valence",
+                        "Keypress", "RT", "Onset", "Offset", "AllKeys"]}
+    formats = {"TrialNum": "%d", "RT": "%.3f", "Onset": "%.4f",
+               "Offset": "%.4f"}
+
+    def __init__(self, logPath, queueSize=LOG_QUEUE, syncInterval=LOG_SYNC):
+        self.logPath = logPath
+        self.sidecarPath = self.GetSidecarPath(logPath)
+        self.syncInterval = syncInterval
+        self.queue = queue.Queue(maxsize=queueSize)
+        self.logFile = open(logPath, 'w')
+        self.sidecarFile = open(self.sidecarPath, 'w')
+        self.writer = threading.Thread(target=self.WriteLoop)
+        self.writer.daemon = True
+        self.writer.start()
+
+    @staticmethod
+    def GetSidecarPath(logPath):
+        """Returns the path of the sidecar belonging to a logfile."""
+        return os.path.splitext(logPath)[0] + ".jsonl"
+
+    @staticmethod
+    def ReadSidecar(sidecarPath):
+        """Reads and returns the records of a sidecar, up to the first
+        incomplete or damaged line.
+        """
+        records = []
+        with open(sidecarPath, 'r') as sidecar:
+            for line in sidecar:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+        return records
+
+    def FormatHeader(self, phase):
+        """Returns the column header line of the trial table of a phase."""
+        return ",".join(self.columns[phase]) + "\n"
+
+    def FormatTrial(self, phase, record):
+        """Returns the line of the trial table of a phase for a record. All
+        keypresses of the trial are written as key:RT pairs separated by
+        semicolons.
+        """
+        values = []
+        for column in self.columns[phase]:
+            value = record[column]
+            if (column == "AllKeys"):
+                value = ";".join(["%s:%.3f" %(key, RT) for (key, RT) in value])
+            values.append(self.formats.get(column, "%s") %(value))
+        return ",".join(values) + "\n"
+
+    def write(self, text):
+        """Queues text for the logfile."""
+        self.queue.put((text, {"type": "text", "text": text}))
+
+    def WriteRecord(self, record):
+        """Queues a record for the sidecar only."""
+        self.queue.put(("", record))
+
+    def WriteTrial(self, phase, record):
+        """Queues a trial, as a line of the phase's trial table in the
+        logfile and as a structured record in the sidecar.
+        """
+        record = dict(record, type="trial", phase=phase)
+        self.queue.put((self.FormatTrial(phase, record), record))
+
+    def WriteLoop(self):
+        """Writer thread. Writes whatever is queued, and syncs the files to
+        disk once LOG_SYNC seconds have passed since the last sync.
+        """
+        lastSync = time.time()
+        pending = False
+        running = True
+        while (running):
+            try:
+                items = [self.queue.get(timeout=self.syncInterval)]
+                while (not self.queue.empty()):
+                    items.append(self.queue.get_nowait())
+            except queue.Empty:
+                items = []
+            for item in items:
+                if (item is None):
+                    running = False
+                    break
+                (text, record) = item
+                self.logFile.write(text)
+                self.sidecarFile.write(json.dumps(record) + "\n")
+                pending = True
+            if (pending and (time.time() - lastSync >= self.syncInterval)):
+                self.Sync()
+                lastSync = time.time()
+                pending = False
+        self.Sync()
+        self.logFile.close()
+        self.sidecarFile.close()
+
+    def Sync(self):
+        """Flushes both files and forces them to disk."""
+        for logFile in (self.logFile, self.sidecarFile):
+            logFile.flush()
+            os.fsync(logFile.fileno())
+
+    def close(self):
+        """Writes everything still queued, syncs and closes the files."""
+        self.queue.put(None)
+        self.writer.join()
@@ -0,0 +1,632 @@
+'''
+
+The Emotional Discrimination Task (EmoDT) and the recovery of interrupted
+sessions. psychopy and PIL are imported by the methods that open the
+window, draw and decode images, and Emo_Score once the session is scored,
+so importing this module is cheap and does not start anything.
+
+'''
+
+from __future__ import division
+import os, time, json, random
+from Emo_Manifest import classify, get_images, load_manifest
+from Emo_Resize import get_cache_dir, get_derivative_path, get_pixel_size
+from emodt.config import FRAME_RATE, STIM_BUDGET, PREFETCH
+from emodt.log import SessionLog
+from emodt.timing import SessionTiming
+from emodt.cache import StimCache
+
+
+class EmoDT(object):
+
+    quiet = False       #Suppresses console reports (used for simulations)
+
+    def __init__(self, subID, logDir, imgDir, tdStudy, tdTest, ITI, imgFill,
+                 timing=False, budget=STIM_BUDGET, prefetch=PREFETCH):
+        
+        #Set passed arguments as class variables
+        self.subID = subID
+        self.logDir = logDir
+        self.imgDir = imgDir
+        self.tdStudy = tdStudy
+        self.tdTest = tdTest
+        self.ITI = ITI
+        self.imgFill = imgFill
+
+        #Create class variables/properties
+        self.log = self.MakeLog()
+        self.manifest = load_manifest(imgDir)
+        self.imgInfo = dict((entry["file"], entry)
+                            for entry in self.manifest["images"])
+        self.studyImgs = self.GetStudyImgs()
+        self.testImgs = self.GetTestImgs()
+        self.window = self.MakeWindow()
+        self.imgScale = self.imgFill*min(self.window.size[0],self.window.size[1])
+        self.cacheDir = get_cache_dir(imgDir, self.imgScale)
+        self.nCached = 0
+        self.frameRate = self.GetFrameRate()
+        self.timing = None
+        if (timing):
+            self.timing = SessionTiming(self.frameRate)
+        self.fixCrs = self.MakeText("+", 100)
+        self.stimCache = StimCache(self.DecodeImage, self.UploadImage,
+                                   budget * 1048576, prefetch, self.timing)
+        self.keyboard = self.MakeKeyboard()
+        self.testTrials = []
+        random.seed(subID)
+
+    def MakeWindow(self):
+        """Creates and returns the full screen window the task is shown in.
+        """
+        from psychopy.visual import Window
+        return Window(fullscr=True, units='pix', color='Black', allowGUI=False)
+
+    def MakeKeyboard(self):
+        """Creates and returns the keyboard responses are collected from.
+        """
+        from psychopy.hardware.keyboard import Keyboard
+        return Keyboard()
+
+    def MakeText(self, msg, height=40, wrapWidth=None):
+        """Creates and returns a white text stimulus on the task window.
+        """
+        from psychopy.visual import TextStim
+        return TextStim(self.window, msg, color='White', height=height,
+                        wrapWidth=wrapWidth)
+
+    def WaitKeys(self, keyList):
+        """Waits for one of the keys in keyList to be pressed, clears any
+        other pending keypresses, and returns the key that was pressed.
+        """
+        from psychopy.event import clearEvents, waitKeys
+        keys = waitKeys(keyList=keyList)
+        clearEvents()
+        return keys[0]
+
+    def ShowMessage(self, msg, keyList=None, wrapWidth=None):
+        """Displays a message on the screen. If keyList is given, waits for
+        one of those keys and returns it.
+        """
+        msgText = self.MakeText(msg, wrapWidth=wrapWidth)
+        msgText.draw(self.window)
+        self.window.flip()
+        if (self.timing):
+            self.timing.Reset()
+        if (keyList):
+            return self.WaitKeys(keyList)
+
+    def MakeLog(self, logTime=None):
+        """Creates and returns a logfile. Each logfile is named with a
+        subject number followed by the stimuli set choice. Also, writes 
+        some initial info about the task at the start of the logfile. If
+        a given logfile already exists with the same subject and stimset,
+        the current one (and its sidecar) is renamed to an "old" version,
+        timestamped with the time it was previously ran.
+
+        Args:
+            -logTime: start time written to the logfile, defaults to now
+        """
+        sub = int(self.subID)
+        imgSet = self.imgDir[-1:]
+        logLoc = (self.logDir + "/%d_%s_log.txt" %(sub, imgSet))
+        logPath = os.path.normpath(logLoc)
+
+        if (os.path.isfile(logPath)):
+            oldLog = open(logPath, 'r')
+            line1 =  oldLog.read(32)
+            oldLog.close()
+            oldTime = line1[12:14] + line1[15:17] + line1[18:20]
+            day = line1[24:26] + line1[27:29] + line1[30:32]
+            date = day + "_" + oldTime
+            oldLogLoc = (self.logDir + "/%d_%s_%s_old.txt" %(sub, imgSet, date))
+            oldLogPath = os.path.normpath(oldLogLoc)
+            os.rename(logPath, oldLogPath)
+            if (os.path.isfile(SessionLog.GetSidecarPath(logPath))):
+                os.rename(SessionLog.GetSidecarPath(logPath),
+                          SessionLog.GetSidecarPath(oldLogPath))
+
+        log = SessionLog(logPath)
+        if (logTime is None):
+            logTime = time.strftime("%H:%M:%S on %m-%d-%y", time.localtime())
+        log.WriteRecord({"type": "session", "subID": sub, "imgDir": self.imgDir,
+                         "tdStudy": self.tdStudy, "tdTest": self.tdTest,
+                         "ITI": self.ITI, "logTime": logTime})
+        log.write("EmoDT Task: %s" %(logTime))
+        log.write("\nSubject ID: %d" %(sub))
+        log.write("\nUsing set %s" %(imgSet))
+        log.write("\nTrial Duration (Study): %.2f" %(self.tdStudy))
+        log.write("\nTrial Duration (Test): %.2f" %(self.tdTest))
+        log.write("\nITI: %.2f\n\n" %(self.ITI))
+
+        return log
+
+    def GetFrameRate(self):
+        """Measures and returns the refresh rate of the window, which is used
+        to convert trial durations into a number of frames. Falls back to
+        FRAME_RATE if the rate cannot be measured reliably. The rate is also
+        written to the logfile.
+        """
+        frameRate = self.window.getActualFrameRate(nIdentical=20,
+                                                   nMaxFrames=240,
+                                                   nWarmUpFrames=20)
+        if (not frameRate):
+            frameRate = FRAME_RATE
+        self.log.write("Refresh Rate: %.2f Hz\n" %(frameRate))
+        return frameRate
+
+    def ToFrames(self, duration):
+        """Converts a duration in seconds into a whole number of frames at
+        the measured refresh rate (at least one frame).
+        """
+        return max(1, int(round(duration * self.frameRate)))
+
+    def GetStudyImgs(self):
+        """Creates and returns a list of images to display for the study
+        phase of the task. Relevant study images are "a" lures, and repeats,
+        which start with 4,5, and 6 (taken from the set manifest).
+        """
+        return get_images(self.manifest, "study")
+
+    def GetTestImgs(self):
+        """Creates and returns a list of images to display for the test
+        phase of the task. Relevant test images are b,c,d, and e lures as 
+        well as repeats (4,5,6) and foils (7,8,9). In other words, any 
+        image that is not an "a" lure (taken from the set manifest).
+        """
+        return get_images(self.manifest, "test")
+
+    def GetTrialType(self, img):
+        """Gets and returns a trial type, for the purpose of writing to
+        a logfile, in order to differentiate the different types of trials.
+        """
+        info = self.imgInfo.get(img) or classify(img)
+        if (info is None):
+            return ""
+        return info["trial_type"]
+
+    def Pause(self):
+        """Pauses the task, and displays a message waiting for a spacebar
+        input from the user before continuing to proceed.
+        """
+        pauseMsg = "Experiment Paused\n\nPress space to continue"
+        self.ShowMessage(pauseMsg, ['space'])
+
+    def ScaleImage(self, image):
+        """Scales the size of the image to fit as largely as it can within the 
+        window of the defined maxSize, while preserving its aspect ratio.
+
+        Args:
+            -image: the filename of the image to be scaled, or an already
+             opened PIL image
+        Return: 
+            -scaledSize: maximum scaling of image
+        """
+        from PIL import Image
+        maxSize = self.imgScale
+        im = image
+        if (not isinstance(image, Image.Image)):
+            im = Image.open(image)
+        larger = im.size[0]
+        if (im.size[0] < im.size[1]):
+            larger = im.size[1]
+        scale = larger / maxSize
+        scaledSize = (im.size[0]/scale, im.size[1]/scale)
+        return scaledSize
+
+    def DecodeImage(self, img):
+        """Decodes an image from the stimulus set and resizes it to its
+        display size. If the image was already rendered at that size (see
+        Emo_Resize.py), the derivative is loaded instead.
+
+        Args:
+            -img: filename of the image to decode
+        Returns:
+            -im: the decoded and resized PIL image
+            -nBytes: decoded size of the image in memory
+        """
+        im = self.LoadDerivative(img)
+        if (im is not None):
+            self.nCached += 1
+            return im, im.size[0] * im.size[1] * len(im.getbands())
+
+        from PIL import Image
+        imgPath = os.path.normpath(self.imgDir + "/" + img)
+        im = Image.open(imgPath)
+        im = im.convert('RGB')
+        imgSize = self.ScaleImage(im)
+        pixSize = (int(round(imgSize[0])), int(round(imgSize[1])))
+        im = im.resize(pixSize, Image.LANCZOS)
+        nBytes = pixSize[0] * pixSize[1] * len(im.getbands())
+        return im, nBytes
+
+    def LoadDerivative(self, img):
+        """Returns the derivative of an image rendered for the current window
+        size, or None if there is none or it does not have the size the image
+        would be scaled to.
+        """
+        info = self.imgInfo.get(img)
+        if (info is None):
+            return None
+        cachePath = get_derivative_path(self.cacheDir, info)
+        if (not os.path.isfile(cachePath)):
+            return None
+        from PIL import Image
+        im = Image.open(cachePath)
+        pixSize = get_pixel_size((info["width"], info["height"]), self.imgScale)
+        if ((im.size != pixSize) or (im.mode != "RGB")):
+            return None
+        im.load()
+        return im
+
+    def UploadImage(self, img, im):
+        """Uploads a decoded image into a ready-to-draw ImageStim. Must be
+        called from the main thread, which owns the window.
+
+        Args:
+            -img: filename of the image
+            -im: the decoded and resized PIL image
+        Returns:
+            -theImage: the sized ImageStim
+        """
+        from psychopy.visual import ImageStim
+        return ImageStim(self.window, image=im, size=im.size)
+
+    def GetImageBytes(self, img):
+        """Returns the decoded size in memory of an image at its display
+        size, from its dimensions in the set manifest.
+        """
+        info = self.imgInfo.get(img)
+        if (info is None):
+            return 0
+        pixSize = get_pixel_size((info["width"], info["height"]), self.imgScale)
+        return pixSize[0] * pixSize[1] * 3
+
+    def PreloadImgs(self):
+        """Decodes and sizes the study and test images once, before the
+        study phase, so that no disk access or JPEG decoding happens between
+        trials. Images are preloaded in study then test order until the
+        memory budget of the stimulus cache is reached; the others are
+        prefetched during the task. The time taken and the memory used are
+        written to the logfile.
+        """
+        self.ShowMessage("Loading images...")
+
+        start = time.perf_counter()
+        stimCache = self.stimCache
+        allImgs = self.studyImgs + self.testImgs
+        for img in allImgs:
+            if ((img not in stimCache.stims) and (stimCache.nBytes +
+                    self.GetImageBytes(img) > stimCache.budget)):
+                break
+            stimCache.Fetch(img)
+        loadTime = time.perf_counter() - start
+        stimCache.ResetCounts()
+
+        report = ("Preloaded %d of %d images in %.2f s (%.1f MB, "
+                  "%d pre-resized)"
+                  %(len(stimCache.stims), len(set(allImgs)), loadTime,
+                    stimCache.nBytes / 1048576, self.nCached))
+        if (not self.quiet):
+            print(report)
+        self.log.write("%s\n" %(report))
+
+    def GetStim(self, img):
+        """Returns the ready-to-draw stimulus for an image from the stimulus
+        cache, loading it on the spot if it was neither preloaded nor
+        prefetched.
+        """
+        return self.stimCache.Fetch(img)
+
+    def RunTrial(self, img, trialDur):
+        """Runs a single trial of the task. This includes displaying an image
+        to the screen for a given number of frames, grabbing keypresses and the
+        corresponding reaction times, displaying a fixation cross for ITI amount
+        of frames, then returning the keypress information. If the keypress is 
+        space, the experiment is paused. If it is escape, then quit the program.
+        Durations are counted in frames of the measured refresh rate, and the
+        times of the flips that show and remove the image are returned.
+
+        The keyboard is polled on every frame of both the image and the ITI.
+        Keypresses are timestamped by the keyboard backend and measured from
+        the flip that showed the image, so the polling rate does not limit 
+        the precision of the reaction times.
+
+        Args:
+            -img: filename of the image to display
+            -trialDur: length of time image stays on screen
+        Returns:
+            -keyPress: first keypress of the trial
+            -RT: reaction time of the first keypress
+            -onset: flip time at which the image appeared
+            -offset: flip time at which the image was replaced by fixation
+            -keyPresses: every (key, RT) pressed during the trial, in order
+        """
+        start = time.perf_counter()
+        theImage = self.GetStim(img)
+        getTime = time.perf_counter() - start
+        stimFrames = self.ToFrames(trialDur)
+        itiFrames = self.ToFrames(self.ITI)
+        keyPresses = []
+
+        self.keyboard.clearEvents()
+        self.window.callOnFlip(self.keyboard.clock.reset)
+        for frame in range(0, stimFrames):
+            flipTime = self.ShowFrame(theImage, keyPresses)
+            if (frame == 0):
+                onset = flipTime
+        for frame in range(0, itiFrames):
+            flipTime = self.ShowFrame(self.fixCrs, keyPresses)
+            if (frame == 0):
+                offset = flipTime
+        if (self.timing):
+            self.timing.timers["trial"].Add(getTime,
+                                            time.perf_counter() - start)
+
+        if (not keyPresses):
+            return '', 0, onset, offset, keyPresses
+        elif (keyPresses[0][0] == "space"):
+            self.Pause()
+            return 'P', 0, onset, offset, keyPresses
+        else:
+            return (keyPresses[0][0], keyPresses[0][1], onset, offset, 
+                    keyPresses)
+
+    def ShowFrame(self, stim, keyPresses):
+        """Draws a stimulus for one frame, flips the window, and adds the
+        keys pressed since the last poll to keyPresses. When timing is on,
+        the draw, flip and poll of the frame are timed.
+
+        Returns:
+            -flipTime: time of the flip
+        """
+        if (not self.timing):
+            stim.draw(self.window)
+            flipTime = self.window.flip()
+            keyPresses.extend(self.PollKeys())
+            return flipTime
+        t0 = time.perf_counter()
+        stim.draw(self.window)
+        t1 = time.perf_counter()
+        flipTime = self.window.flip()
+        t2 = time.perf_counter()
+        keyPresses.extend(self.PollKeys())
+        t3 = time.perf_counter()
+        self.timing.AddFrame(t1 - t0, t2 - t1, t3 - t2, flipTime)
+        return flipTime
+
+    def PollKeys(self):
+        """Collects the valid keys pressed since the last poll, along with
+        their reaction times relative to the last keyboard clock reset.
+        """
+        validKeys = ["1", "2", "3", "escape", "space"]
+        keys = self.keyboard.getKeys(keyList=validKeys, waitRelease=False,
+                                     clear=True)
+        return [(key.name, key.rt) for key in keys]
+
+    def WriteTiming(self, phase, durations, trialDur):
+        """Writes a summary of the achieved image durations of a phase to
+        the logfile: how many trials were within one frame of the requested
+        trial duration, and the largest deviation.
+
+        Args:
+            -phase: name of the phase ("Study" or "Test")
+            -durations: measured on-screen duration of each trial
+            -trialDur: requested trial duration
+        """
+        if (not durations):
+            return
+        frameDur = 1.0 / self.frameRate
+        errors = [abs(dur - trialDur) for dur in durations]
+        hits = len([err for err in errors if err <= frameDur])
+        self.log.write("\n%s Timing: %d of %d trials within one frame "
+                       "(%.1f ms) of %.2f s, max error %.1f ms\n"
+                       %(phase, hits, len(durations), frameDur*1000,
+                         trialDur, max(errors)*1000))
+
+    def RunStudy(self):
+        """Runs the study phase of the task. During this phase, a trial is 
+        run for each of the study images in random order, and for each trial,
+        a line of information regarding that trial is written to the logfile.
+        """
+        log = self.log
+        studyMsg = ("%s1%s2%s3\n\nNegative%sNeutral%sPositive"
+                    "\n\n\n%sPress space to begin"
+                    %(" "*5, " "*18, " "*17, " "*7, " "*7, " "*10))
+        continueKey = self.ShowMessage(studyMsg, ['space', 'escape'],
+                                       wrapWidth=0.8*self.window.size[0])
+        if (continueKey == 'escape'):
+            log.write("\n\n\n#### Study Not Run ####\n\n\n")
+            return
+        log.write("\n\nBegin Study\n\n")
+        log.write(log.FormatHeader("Study"))
+        
+        studyImgs = self.studyImgs
+        trialDur = self.tdStudy
+        durations = []
+        random.shuffle(studyImgs)
+        self.stimCache.Prefetch(studyImgs)
+        for i in range(0, len(studyImgs)):
+            img = studyImgs[i]
+            tType = self.GetTrialType(img)
+            self.stimCache.Prefetch(studyImgs[i+1:])
+            (resp, RT, onset, offset, keys) = self.RunTrial(img, trialDur)
+            if (resp == "escape"):
+                log.write("\n### Study Terminated Early ###\n")
+                return
+            log.WriteTrial("Study", {"TrialNum": i+1, "Image": img,
+                                     "TrialType": tType, "Keypress": resp,
+                                     "RT": RT, "Onset": onset,
+                                     "Offset": offset, "AllKeys": keys})
+            durations.append(offset - onset)
+        self.WriteTiming("Study", durations, trialDur)
+
+
+    def RunTest(self):
+        """Runs the test phase of the task. During this phase, a trial is 
+        run for each of the test images in random order, and for each trial,
+        a line of information regarding that trial is written to the logfile.
+        Additionally, the trial type, valence and response of each trial
+        are kept for scoring by WriteScores()
+        """
+        log = self.log
+        testMsg = ("Have you seen this EXACT image before?\n\n"
+                    "%s1%s2\n\n%sYes%sNo\n\n\n\n%sPress space to begin"
+                    %(" "*20," "*20," "*20," "*15, " "*15))
+        continueKey = self.ShowMessage(testMsg, ['space', 'escape'],
+                                       wrapWidth=0.8*self.window.size[0])
+        if (continueKey == 'escape'):
+            log.write("\n\n\n#### Test Not Run ####\n\n\n")
+            return
+        log.write("\n\nBegin Test\n\n")
+        log.write(log.FormatHeader("Test"))
+
+        testImgs = self.testImgs
+        trialDur = self.tdTest
+        durations = []
+        random.shuffle(testImgs)
+        self.stimCache.Prefetch(testImgs)
+        for i in range(0, len(testImgs)):
+            img = testImgs[i]
+            val = img[0]
+            tType = self.GetTrialType(img)
+            self.stimCache.Prefetch(testImgs[i+1:])
+            (resp, RT, onset, offset, keys) = self.RunTrial(img, trialDur)
+            #resp = str(random.randint(1,2))
+            if (resp == "escape"):
+                log.write("\n### Test Terminated Early ###\n")
+                return
+            log.WriteTrial("Test", {"TrialNum": i+1, "Image": img,
+                                    "TrialType": tType, "Valence": val,
+                                    "Keypress": resp, "RT": RT,
+                                    "Onset": onset, "Offset": offset,
+                                    "AllKeys": keys})
+            durations.append(offset - onset)
+            self.testTrials.append((tType, val, resp))
+        self.WriteTiming("Test", durations, trialDur)
+
+    def WriteScores(self):
+        """Scores the test trials with Emo_Score, and writes the LDI and
+        RecMem scores to the logfile.
+        """
+        from Emo_Score import SCORE_LABELS, score_session
+        (types, vals, resps) = ([], [], [])
+        if (self.testTrials):
+            (types, vals, resps) = zip(*self.testTrials)
+        scores = score_session(types, vals, resps)
+
+        self.log.write("\n\n\nScores:\n\n")
+        for (i, label) in enumerate(SCORE_LABELS):
+            self.log.write("\n%s: %.2f" %(label, scores[label]))
+            if (i in [5, 8]):
+                self.log.write("\n\n")
+
+    def WriteTimingReport(self):
+        """Writes the timing report of the session (see SessionTiming)
+        next to the logfile, as <log>_timing.json, and prints it.
+        """
+        report = self.timing.GetReport()
+        reportPath = os.path.splitext(self.log.logPath)[0] + "_timing.json"
+        with open(reportPath, 'w') as reportFile:
+            json.dump(report, reportFile, indent=1, sort_keys=True)
+        if (not self.quiet):
+            print(self.timing.FormatReport(report))
+
+    def WriteCacheReport(self):
+        """Stops the prefetch thread and writes to the logfile how the
+        stimuli of the trials were obtained: already in the stimulus cache,
+        prefetched, or decoded on the spot, and how many were evicted.
+        """
+        stimCache = self.stimCache
+        stimCache.close()
+        self.log.write("\nStimulus Cache: %d preloaded or cached, %d "
+                       "prefetched, %d decoded on the spot, %d evicted "
+                       "(budget %.0f MB)\n"
+                       %(stimCache.nReady, stimCache.nPrefetched,
+                         stimCache.nMissed, stimCache.nEvicted,
+                         stimCache.budget / 1048576))
+
+    def EndExp(self):
+        """Ends the experiment. Prompts user to press escape, then closes
+        the window and logfile. The timing report is written first, if
+        timing is on.
+        """
+        if (self.timing):
+            self.WriteTimingReport()
+        self.WriteCacheReport()
+        exitMsg = "Thanks for participating!\n\nPress Esc to finish"
+        self.ShowMessage(exitMsg, ['escape'])
+        self.window.close()
+        self.log.close()
+
+    def RunTask(self):
+        """Runs the task. First preloads the stimuli, then runs the study
+        phase, then the test phase. After the phases are over, scores are
+        written to the logfile, and finally the task finishes.
+        """
+
+        self.PreloadImgs()
+        self.RunStudy()
+        self.RunTest()
+        self.WriteScores()
+        self.EndExp()
+
+
+class RecoveredEmoDT(EmoDT):
+    """Rebuilds the logfile of an interrupted session from its sidecar.
+    The partial logfile and sidecar are first moved aside with a ".partial"
+    extension, so writing the new ones never touches the records being
+    recovered; every record is written again to a new logfile and sidecar,
+    and if the session ended before its scores were written, they are
+    computed from the recovered test trials. The moved sidecar is removed
+    once the new one is closed, while the partial logfile is kept for
+    checking the rebuilt one; if a recovery is interrupted in turn,
+    running it again reads the records from the moved sidecar.
+    """
+
+    def __init__(self, sidecarPath):
+        sidecarPath = os.path.abspath(sidecarPath)
+        if (sidecarPath.endswith(".partial")):
+            sidecarPath = sidecarPath[:-len(".partial")]
+        logPath = os.path.splitext(sidecarPath)[0] + ".txt"
+        self.partialPath = sidecarPath + ".partial"
+        #A moved sidecar is left only by an interrupted recovery, whose new
+        #files are incomplete copies of the moved ones
+        if (not os.path.isfile(self.partialPath)):
+            os.replace(sidecarPath, self.partialPath)
+            if (os.path.isfile(logPath)):
+                os.replace(logPath, logPath + ".partial")
+        self.records = SessionLog.ReadSidecar(self.partialPath)
+        session = self.records[0]
+        self.subID = session["subID"]
+        self.logDir = os.path.dirname(sidecarPath)
+        self.imgDir = session["imgDir"]
+        self.tdStudy = session["tdStudy"]
+        self.tdTest = session["tdTest"]
+        self.ITI = session["ITI"]
+        self.timing = None
+        self.testTrials = []
+        self.log = SessionLog(logPath)
+
+    def RunTask(self):
+        """Writes the recovered records, then the scores if they are
+        missing, closes the new logfile and removes the moved sidecar.
+        """
+        scored = False
+        for record in self.records:
+            if (record["type"] == "text"):
+                self.log.write(record["text"])
+                scored = scored or ("Scores:" in record["text"])
+            elif (record["type"] == "trial"):
+                self.log.WriteTrial(record["phase"], record)
+                if (record["phase"] == "Test"):
+                    self.testTrials.append((record["TrialType"],
+                                            record["Valence"],
+                                            record["Keypress"]))
+            else:
+                self.log.WriteRecord(record)
+
+        if (not scored):
+            self.log.write("\n### Session Recovered ###\n")
+            self.WriteScores()
+        self.log.close()
+        os.remove(self.partialPath)
@@ -0,0 +1,125 @@
+'''
+
+Opt-in timing instrumentation of EmoDT sessions (--timing).
+
+'''
+
+from __future__ import division
+import math, array, platform
+from emodt.config import TIMING_SIZE, DROP_FACTOR
+
+
+class TimingBuffer(object):
+    """Ring buffer of high resolution timings. Each sample holds one
+    duration per stage, kept in a flat array of doubles allocated once, so
+    adding a sample never allocates. Once the buffer is full the oldest
+    samples are overwritten; count is the number of samples ever added.
+    """
+
+    def __init__(self, stages, capacity=TIMING_SIZE):
+        self.stages = stages
+        self.capacity = capacity
+        self.samples = array.array('d', [0.0]) * (capacity * len(stages))
+        self.count = 0
+
+    def Add(self, *durations):
+        """Adds a sample of one duration per stage, in seconds."""
+        start = (self.count % self.capacity) * len(self.stages)
+        for (i, duration) in enumerate(durations):
+            self.samples[start + i] = duration
+        self.count += 1
+
+    def GetStage(self, stage):
+        """Returns the durations of a stage still in the buffer, skipping
+        missing (NaN) ones.
+        """
+        nStages = len(self.stages)
+        end = min(self.count, self.capacity) * nStages
+        values = self.samples[self.stages.index(stage):end:nStages]
+        return [value for value in values if value == value]
+
+    def Summarize(self):
+        """Returns the number of samples, mean, 50th, 95th and 99th
+        percentiles and max of each stage, in milliseconds.
+        """
+        summary = {}
+        for stage in self.stages:
+            values = sorted(self.GetStage(stage))
+            if (not values):
+                continue
+            rank = lambda q: values[max(0, int(math.ceil(q * len(values))) - 1)]
+            summary[stage] = {"n": len(values),
+                              "mean": 1000 * sum(values) / len(values),
+                              "p50": 1000 * rank(0.50),
+                              "p95": 1000 * rank(0.95),
+                              "p99": 1000 * rank(0.99),
+                              "max": 1000 * values[-1]}
+        return summary
+
+
+class SessionTiming(object):
+    """Opt-in timing instrumentation of a session (--timing). Keeps ring
+    buffers of the time spent in each stage of preloading every image
+    (decode: open, decode and resize, upload: ImageStim creation), of every
+    trial (get: stimulus lookup, trial: whole trial) and of every frame
+    (draw, flip, keys: keyboard poll, interval: time since the previous
+    flip), along with the number of dropped frames: frames a flip interval
+    over DROP_FACTOR frames missed.
+    """
+
+    buffers = (("load", ("decode", "upload")),
+               ("trial", ("get", "trial")),
+               ("frame", ("draw", "flip", "keys", "interval")))
+
+    def __init__(self, frameRate, capacity=TIMING_SIZE):
+        self.frameRate = frameRate
+        self.dropLimit = DROP_FACTOR / frameRate
+        self.timers = dict((name, TimingBuffer(stages, capacity))
+                           for (name, stages) in self.buffers)
+        self.nDropped = 0
+        self.lastFlip = None
+
+    def AddFrame(self, draw, flip, keys, flipTime):
+        """Adds the stage durations of a frame, and counts the frames
+        missed since the previous flip.
+        """
+        interval = float('nan')
+        if (self.lastFlip is not None):
+            interval = flipTime - self.lastFlip
+            if (interval > self.dropLimit):
+                self.nDropped += int(round(interval * self.frameRate)) - 1
+        self.lastFlip = flipTime
+        self.timers["frame"].Add(draw, flip, keys, interval)
+
+    def Reset(self):
+        """Forgets the last flip, so that waiting on a message screen is
+        not counted as dropped frames.
+        """
+        self.lastFlip = None
+
+    def GetReport(self):
+        """Returns the timing report of the session as a dict."""
+        stages = {}
+        for (name, stageNames) in self.buffers:
+            stages.update(self.timers[name].Summarize())
+        return {"host": platform.node(), "frameRate": self.frameRate,
+                "frames": self.timers["frame"].count,
+                "trials": self.timers["trial"].count,
+                "droppedFrames": self.nDropped, "stages": stages}
+
+    def FormatReport(self, report):
+        """Returns a timing report as a table of the stages."""
+        lines = ["Timing: %d frames in %d trials at %.2f Hz, %d dropped"
+                 %(report["frames"], report["trials"], report["frameRate"],
+                   report["droppedFrames"]),
+                 "%-10s%8s%9s%9s%9s%9s%9s (ms)"
+                 %("stage", "n", "mean", "p50", "p95", "p99", "max")]
+        for (name, stageNames) in self.buffers:
+            for stage in stageNames:
+                if (stage in report["stages"]):
+                    stats = report["stages"][stage]
+                    lines.append("%-10s%8d%9.3f%9.3f%9.3f%9.3f%9.3f"
+                                 %(stage, stats["n"], stats["mean"],
+                                   stats["p50"], stats["p95"], stats["p99"],
+                                   stats["max"]))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,293 @@
+'''
+
+module          : emomdt_headless.py
+usage           : python emomdt_headless.py -n 1000 --set A
+
+Runs simulated sessions of the Emotional Discrimination Task without a
+display or a keyboard. The psychopy window and keyboard used by EmoDT are
+replaced by in-memory stand-ins running on a simulated clock, so frames
+are "flipped" instantly, and a synthetic participant presses keys with a
+configurable accuracy per trial type and an ex-Gaussian RT distribution.
+The study and test phases, scoring and logging are the ones of EmoDT, so
+the logs written here are real logs that Emo_Data.py can read.
+
+Lowering --fps compresses the timing further: trial durations are still
+counted in frames, but fewer frames are simulated per trial. Keypresses
+are timestamped exactly, so the RTs do not depend on the frame rate.
+
+'''
+
+from __future__ import division
+import os, sys, random, time, argparse
+from emodt import EmoDT, setDict, logDir, TD_STUDY, TD_TEST, ITI, IMG_FILL
+
+### Simulation defaults ###
+SIM_SIZE = (1920, 1080)     #Simulated screen size
+SIM_FPS = 60                #Simulated refresh rate
+SIM_LOC = 'sim'             #Subfolder of the log folder for simulated logs
+ACCURACY = {"Study": 0.80,  #Proportion of correct responses per trial type
+            "LureLow": 0.60,
+            "LureHigh": 0.40,
+            "Repeat": 0.85,
+            "Foil": 0.90}
+RT_MU = 0.60                #Ex-Gaussian RT parameters, in seconds
+RT_SIGMA = 0.10
+RT_TAU = 0.20
+MISS_RATE = 0.02            #Proportion of trials without a response
+
+
+class SimClock(object):
+    """Clock running on the simulated time of a SimWindow."""
+
+    def __init__(self, window):
+        self.window = window
+        self.startTime = window.time
+
+    def reset(self):
+        self.startTime = self.window.time
+
+    def getTime(self):
+        return self.window.time - self.startTime
+
+
+class SimStim(object):
+    """Stand-in for an ImageStim or TextStim. Drawing it only records its
+    name as the content of the next frame.
+    """
+
+    def __init__(self, window, name):
+        self.window = window
+        self.name = name
+
+    def draw(self, win=None):
+        self.window.drawn = self.name
+
+
+class SimWindow(object):
+    """In-memory stand-in for a psychopy Window. Each flip advances the
+    simulated time by one frame and returns it, without waiting. Listeners
+    are told about every new image that appears on screen.
+    """
+
+    def __init__(self, size=SIM_SIZE, frameRate=SIM_FPS):
+        self.size = size
+        self.frameRate = frameRate
+        self.time = 0.0
+        self.drawn = None
+        self.shown = None
+        self.onFlip = []
+        self.listeners = []
+
+    def getActualFrameRate(self, **kwargs):
+        return self.frameRate
+
+    def callOnFlip(self, function, *args, **kwargs):
+        self.onFlip.append((function, args, kwargs))
+
+    def flip(self, clearBuffer=True):
+        self.time += 1.0 / self.frameRate
+        for (function, args, kwargs) in self.onFlip:
+            function(*args, **kwargs)
+        self.onFlip = []
+        if (self.drawn != self.shown):
+            for listener in self.listeners:
+                listener(self.drawn, self.time)
+        self.shown = self.drawn
+        self.drawn = None
+        return self.time
+
+    def close(self):
+        pass
+
+
+class SimKey(object):
+    """Keypress returned by SimKeyboard, like psychopy's KeyPress."""
+
+    def __init__(self, name, tDown, rt):
+        self.name = name
+        self.tDown = tDown
+        self.rt = rt
+
+
+class SimKeyboard(object):
+    """In-memory stand-in for a psychopy Keyboard. When a new image appears
+    on the window, the responder decides which key is pressed and when, and
+    the press becomes available once the simulated time has reached it.
+    """
+
+    def __init__(self, window, responder):
+        self.window = window
+        self.responder = responder
+        self.clock = SimClock(window)
+        self.pending = []
+        window.listeners.append(self.OnStim)
+
+    def OnStim(self, name, flipTime):
+        response = self.responder.Respond(name)
+        if (response):
+            (key, RT) = response
+            self.pending.append((key, flipTime + RT))
+
+    def clearEvents(self):
+        self.pending = []
+
+    def getKeys(self, keyList=None, waitRelease=False, clear=True):
+        now = self.window.time
+        keys = []
+        remaining = []
+        for (key, tDown) in self.pending:
+            if (tDown <= now and (keyList is None or key in keyList)):
+                keys.append(SimKey(key, tDown, tDown - self.clock.startTime))
+            else:
+                remaining.append((key, tDown))
+        if (clear):
+            self.pending = remaining
+        return keys
+
+
+class SimResponder(object):
+    """Synthetic participant. During the study phase it rates the valence
+    of each image (1, 2 or 3), during the test phase it answers old (1) or
+    new (2). Responses are correct with the probability configured for the
+    trial type, and RTs are drawn from an ex-Gaussian distribution.
+    """
+
+    def __init__(self, getTrialType, accuracy=ACCURACY, rtMu=RT_MU,
+                 rtSigma=RT_SIGMA, rtTau=RT_TAU, missRate=MISS_RATE, seed=0):
+        self.getTrialType = getTrialType
+        self.accuracy = accuracy
+        self.rtMu = rtMu
+        self.rtSigma = rtSigma
+        self.rtTau = rtTau
+        self.missRate = missRate
+        self.rng = random.Random(seed)
+        self.phase = "Study"
+
+    def Respond(self, name):
+        """Returns the (key, RT) response to an image, or None for anything
+        that is not an image and for missed trials.
+        """
+        if ((name is None) or (not name.endswith(".jpg"))):
+            return None
+        rng = self.rng
+        if (rng.random() < self.missRate):
+            return None
+        RT = max(0.1, rng.gauss(self.rtMu, self.rtSigma) +
+                 rng.expovariate(1.0 / self.rtTau))
+
+        if (self.phase == "Study"):
+            correct = str((int(name[0]) + 2) % 3 + 1)
+            if (rng.random() < self.accuracy["Study"]):
+                return correct, RT
+            return rng.choice([k for k in "123" if k != correct]), RT
+
+        trialType = self.getTrialType(name)
+        if (trialType in ["LureB", "LureD"]):
+            (category, correct) = ("LureLow", "2")
+        elif (trialType in ["LureC", "LureE"]):
+            (category, correct) = ("LureHigh", "2")
+        elif ("R-" in trialType):
+            (category, correct) = ("Repeat", "1")
+        else:
+            (category, correct) = ("Foil", "2")
+        if (rng.random() < self.accuracy[category]):
+            return correct, RT
+        return ("2" if correct == "1" else "1"), RT
+
+
+class HeadlessEmoDT(EmoDT):
+    """EmoDT running on a SimWindow and SimKeyboard, driven by a
+    SimResponder. Instruction screens are acknowledged immediately. Images
+    are only decoded if decode is set, to include loading in profiles.
+    """
+
+    quiet = True
+
+    def __init__(self, subID, logDir, imgDir, tdStudy, tdTest, ITI, imgFill,
+                 responderArgs={}, frameRate=SIM_FPS, decode=False):
+        #Seeded by subject and set, so the sessions of a subject differ
+        setName = os.path.basename(os.path.normpath(imgDir))
+        self.responderArgs = dict(responderArgs,
+                                  seed="%d-%s" % (subID, setName))
+        self.simFrameRate = frameRate
+        self.decode = decode
+        EmoDT.__init__(self, subID, logDir, imgDir, tdStudy, tdTest, ITI,
+                       imgFill)
+
+    def MakeWindow(self):
+        return SimWindow(frameRate=self.simFrameRate)
+
+    def MakeKeyboard(self):
+        self.responder = SimResponder(self.GetTrialType, **self.responderArgs)
+        return SimKeyboard(self.window, self.responder)
+
+    def MakeText(self, msg, height=40, wrapWidth=None):
+        return SimStim(self.window, msg)
+
+    def WaitKeys(self, keyList):
+        if ("space" in keyList):
+            return "space"
+        return keyList[0]
+
+    def DecodeImage(self, img):
+        if (self.decode):
+            return EmoDT.DecodeImage(self, img)
+        return None, 0
+
+    def UploadImage(self, img, im):
+        return SimStim(self.window, img)
+
+    def RunStudy(self):
+        self.responder.phase = "Study"
+        EmoDT.RunStudy(self)
+
+    def RunTest(self):
+        self.responder.phase = "Test"
+        EmoDT.RunTest(self)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs simulated EmoDT "
+                                     "sessions without a display.")
+    parser.add_argument('-n', '--sessions', type=int, default=1,
+                        help="Number of sessions to simulate")
+    parser.add_argument('--set', default='A', choices=sorted(setDict),
+                        help="Stimuli set")
+    parser.add_argument('--first-sub', type=int, default=90000,
+                        help="Subject ID of the first simulated session")
+    parser.add_argument('--log-dir', default=os.path.join(logDir, SIM_LOC),
+                        help="Folder for the simulated logs")
+    parser.add_argument('--fps', type=float, default=SIM_FPS,
+                        help="Simulated refresh rate (lower is faster)")
+    parser.add_argument('--decode', action='store_true',
+                        help="Decode and resize the images while preloading")
+    for (category, accuracy) in sorted(ACCURACY.items()):
+        parser.add_argument('--acc-%s' %(category.lower()), type=float,
+                            default=accuracy, dest=category,
+                            help="Accuracy for %s trials" %(category))
+    parser.add_argument('--rt-mu', type=float, default=RT_MU)
+    parser.add_argument('--rt-sigma', type=float, default=RT_SIGMA)
+    parser.add_argument('--rt-tau', type=float, default=RT_TAU)
+    parser.add_argument('--miss-rate', type=float, default=MISS_RATE)
+    args = parser.parse_args()
+
+    if (not os.path.isdir(args.log_dir)):
+        os.makedirs(args.log_dir)
+    responderArgs = {
+        'accuracy': dict((cat, getattr(args, cat)) for cat in ACCURACY),
+        'rtMu': args.rt_mu, 'rtSigma': args.rt_sigma, 'rtTau': args.rt_tau,
+        'missRate': args.miss_rate}
+
+    start = time.perf_counter()
+    for subID in range(args.first_sub, args.first_sub + args.sessions):
+        task = HeadlessEmoDT(subID, args.log_dir, setDict[args.set], TD_STUDY,
+                             TD_TEST, ITI, IMG_FILL, responderArgs, args.fps,
+                             args.decode)
+        task.RunTask()
+    elapsed = time.perf_counter() - start
+    print("Simulated %d sessions in %.2f s (%.0f sessions/min)"
+          %(args.sessions, elapsed, 60 * args.sessions / elapsed))
+
+
+if __name__ == '__main__':
+    main()
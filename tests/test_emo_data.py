@@ -0,0 +1,69 @@
+import os
+import sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import Emo_Data
+import Emo_Score
+
+#The report keeps the scores of the original Emo_Data.py, 10 of the 12
+SCORE_COLUMNS = Emo_Data.RPT_HEADERS[4:-1]
+SAMPLE_LOG = os.path.join(ROOT, 'logs', '8601_A_log.txt')
+HEADER = ("EmoDT Task: 16:48:52 on 10-04-21\nSubject ID: 9001\nUsing set B\n"
+          "Trial Duration (Study): 2.50\nTrial Duration (Test): 2.50\nITI: 0.50\n\n\n\n")
+
+
+def make_log(seed=0, n=60):
+    """Returns the text of a full session log, written like emomdt.py, and
+    its test trials as (type, valence, key) lists."""
+    rng = np.random.default_rng(seed)
+    kinds = [('1', 'b', 'LureB'), ('2', 'c', 'LureC'), ('3', 'd', 'LureD'), ('1', 'e', 'LureE'),
+             ('4', '', 'R-Neg'), ('5', '', 'R-Neu'), ('6', '', 'R-Pos'),
+             ('7', '', 'F-Neg'), ('8', '', 'F-Neu'), ('9', '', 'F-Pos')]
+    text = HEADER + "\n\nBegin Study\n\nTrialNum,Image,TrialType,Keypress,RT\n"
+    for i in range(n):
+        text += "%d,1%04da.jpg,LureA,,0.00\n" % (i + 1, i)
+    text += "\n\nBegin Test\n\nTrialNum,Image,TrialType,Valence,Keypress,RT\n"
+    trials = ([], [], [])
+    for i in range(n):
+        digit, letter, tType = kinds[rng.integers(len(kinds))]
+        resp = ['1', '2', 'None'][rng.integers(3)]
+        text += "%d,%s%04d%s.jpg,%s,%s,%s,%.2f\n" % (i + 1, digit, i, letter, tType, digit, resp, rng.random())
+        for values, value in zip(trials, (tType, digit, resp)):
+            values.append(value)
+    scores = Emo_Score.score_session(*trials)
+    text += "\n\n\nScores:\n\n"
+    for label in Emo_Score.SCORE_LABELS:
+        text += "\n%s: %.2f" % (label, scores[label])
+    return text, trials
+
+
+def test_parse_sample_log():
+    record, blocks = Emo_Data.parse_log(SAMPLE_LOG)
+    assert record[:2] == ('8601', 'A')
+    assert record[4:] == (0.0,) * len(SCORE_COLUMNS)
+    #The session was stopped during the study phase: no test trials
+    assert [block[0] for block in blocks] == ['Study']
+    assert blocks[0][3] == 31
+    df = Emo_Data.get_trial_table([('8601_A_log', '8601', 'A', blocks)])
+    assert len(df) == 31 and (df['phase'] == 'Study').all()
+
+
+def test_parse_full_log():
+    text, trials = make_log()
+    record, blocks = Emo_Data.parse_log_text('9001_B_log.txt', text, 0.0)
+    assert record[:2] == ('9001', 'B')
+    scores = Emo_Score.score_session(*trials)
+    labels = dict(zip(Emo_Score.SCORE_COLUMNS, Emo_Score.SCORE_LABELS))
+    assert list(record[4:]) == [round(scores[labels[column]], 2) for column in SCORE_COLUMNS]
+    assert [(block[0], block[3]) for block in blocks] == [('Study', 60), ('Test', 60)]
+    df = Emo_Data.get_trial_table([('9001_B_log', '9001', 'B', blocks)])
+    df_scores = Emo_Score.score_table(df.loc[df['phase'] == 'Test'], ['subject'], decimals=2)
+    assert list(df_scores.iloc[0][SCORE_COLUMNS]) == list(record[4:])
+
+
+def test_parse_log_without_scores():
+    text = make_log()[0]
+    record, blocks = Emo_Data.parse_log_text('9001_B_log.txt', text[:text.index('Scores:')], 0.0)
+    assert record is None and len(blocks) == 2
@@ -0,0 +1,84 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Emo_Score
+
+TRIAL_TYPES = ['LureB', 'LureC', 'LureD', 'LureE', 'R-Neg', 'R-Neu', 'R-Pos', 'F-Neg', 'F-Neu', 'F-Pos']
+
+
+def legacy_scores(trial_types, valences, keys):
+    """The scoring of the original emomdt.py (SetScore and WriteScores)."""
+    scoreList = [[[0, 0], [0, 0], [0, 0], [0, 0]] for i in range(3)]
+    for trialType, val, resp in zip(trial_types, valences, keys):
+        if resp not in ("1", "2"):
+            continue
+        resp = int(resp)
+        i = (int(val) + 2) % 3
+        sim = 0
+        if trialType in ["LureB", "LureD"]:
+            sim = 1
+        elif trialType in ["LureC", "LureE"]:
+            sim = 2
+        if "Lure" in trialType and sim in (1, 2):
+            scoreList[i][sim - 1][resp - 1] += 1
+        elif "R-" in trialType:
+            scoreList[i][2][resp - 1] += 1
+        elif "F-" in trialType:
+            scoreList[i][3][resp - 1] += 1
+
+    def GetProps(cat, cor):
+        props = []
+        for i in range(0, 3):
+            valResp = scoreList[i][cat][0] + scoreList[i][cat][1]
+            props.append(0 if valResp == 0 else scoreList[i][cat][cor - 1] / valResp)
+        return props
+
+    lowCRs, highCRs = GetProps(0, 2), GetProps(1, 2)
+    hits, misses, oldFoils = GetProps(2, 1), GetProps(2, 2), GetProps(3, 1)
+    values = []
+    for i in range(3):
+        values += [lowCRs[i] - misses[i], highCRs[i] - misses[i]]
+    values += [(lowCRs[i] + highCRs[i]) / 2 - misses[i] for i in range(3)]
+    values += [hits[i] - oldFoils[i] for i in range(3)]
+    return values
+
+
+def make_session(rng, n=150):
+    trial_types = rng.choice(TRIAL_TYPES, n)
+    valences = [str(rng.integers(1, 10)) for i in range(n)]
+    keys = rng.choice(['1', '2', '1', '2', 'None', '3'], n)
+    return list(trial_types), valences, list(keys)
+
+
+def test_score_session_matches_legacy():
+    rng = np.random.default_rng(0)
+    for session in range(20):
+        trial_types, valences, keys = make_session(rng, n=int(rng.integers(1, 200)))
+        scores = Emo_Score.score_session(trial_types, valences, keys)
+        expected = legacy_scores(trial_types, valences, keys)
+        assert np.allclose([scores[label] for label in Emo_Score.SCORE_LABELS], expected)
+        #Logged scores are written with '%.2f'
+        assert ['%.2f' % scores[label] for label in Emo_Score.SCORE_LABELS] == \
+            ['%.2f' % value for value in expected]
+
+
+def test_score_table_matches_sessions():
+    rng = np.random.default_rng(1)
+    frames = []
+    for ID in range(5):
+        trial_types, valences, keys = make_session(rng)
+        frames.append(pd.DataFrame({'ID': ID, 'type': trial_types, 'valence': valences, 'key': keys}))
+    df_trials = pd.concat(frames, ignore_index=True)
+    df_scores = Emo_Score.score_table(df_trials, ['ID'], decimals=2)
+    for ID, frame in zip(range(5), frames):
+        expected = legacy_scores(frame['type'], frame['valence'], frame['key'])
+        assert list(df_scores.loc[ID]) == [round(value, 2) for value in expected]
+
+
+def test_score_table_empty():
+    df_trials = pd.DataFrame({'ID': [], 'type': [], 'valence': [], 'key': []})
+    df_scores = Emo_Score.score_table(df_trials, ['ID'], decimals=2)
+    assert len(df_scores) == 0 and list(df_scores.columns) == Emo_Score.SCORE_COLUMNS
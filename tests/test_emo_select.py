@@ -0,0 +1,69 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Emo_Select
+
+CONFIG = {'sets': 3, 'seed': 7,
+          'quotas': [{'role': 'Lure', 'sim': 'LOW', 'count': 2, 'by': ['valence']},
+                     {'role': 'Lure', 'sim': 'HIGH', 'count': 2, 'by': ['valence']},
+                     {'role': 'Repeat', 'count': 3, 'by': ['valence']},
+                     {'role': 'Foil', 'count': 3, 'by': ['valence']},
+                     {'role': 'LureA', 'count': 1, 'by': ['valence']}]}
+
+
+def make_pool(n=40):
+    """Image paths of n image numbers per valence digit, each lure number
+    with its a version and a low or high similarity version."""
+    pnames = []
+    for digit in range(1, 10):
+        for number in range(1, n + 1):
+            stim = '%d%04d' % (digit, number)
+            if digit <= 3:
+                pnames += ['pool/%sa.jpg' % stim, 'pool/%s%s.jpg' % (stim, 'bcde'[number % 4])]
+            else:
+                pnames.append('pool/%s.jpg' % stim)
+    return pnames + ['pool/readme.txt']
+
+
+def test_select_sets_balanced():
+    df = Emo_Select.select_sets(Emo_Select.get_pool(make_pool()), dict(CONFIG))
+    assert sorted(df['set'].unique()) == ['setA', 'setB', 'setC']
+    for number, quota in enumerate(CONFIG['quotas']):
+        df_quota = df.loc[df['quota'] == number]
+        if quota['role'] == 'Lure':
+            df_quota = df_quota.loc[df_quota['role'] != 'LureA']
+            assert (df_quota['sim'] == quota['sim']).all()
+        counts = df_quota.groupby(['set', 'valence'], observed=False).size()
+        assert (counts == quota['count']).all() and len(counts) == 9
+    #No image number in two sets, and every lure has its a version in its set
+    assert df.groupby('stim')['set'].nunique().max() == 1
+    lures = df.loc[df['role'].isin(['LureB', 'LureC', 'LureD', 'LureE'])]
+    studied = set(zip(df.loc[df['role'] == 'LureA', 'stim'], df.loc[df['role'] == 'LureA', 'set']))
+    assert all((stim, Set) in studied for stim, Set in zip(lures['stim'], lures['set']))
+
+
+def test_select_sets_seeded():
+    df_pool = Emo_Select.get_pool(make_pool())
+    first = Emo_Select.select_sets(df_pool, dict(CONFIG))
+    again = Emo_Select.select_sets(df_pool, dict(CONFIG))
+    other = Emo_Select.select_sets(df_pool, dict(CONFIG, seed=8))
+    assert list(zip(first['pname'], first['set'])) == list(zip(again['pname'], again['set']))
+    assert list(zip(first['pname'], first['set'])) != list(zip(other['pname'], other['set']))
+
+
+def test_select_sets_groups():
+    df_pool = Emo_Select.get_pool(make_pool())
+    rng = np.random.default_rng(0)
+    rows_i, rows_j = rng.integers(0, len(df_pool), size=(2, 60))
+    df_pool = Emo_Select.set_groups(df_pool, rows_i, rows_j)
+    df = Emo_Select.select_sets(df_pool, dict(CONFIG))
+    assert df.groupby('group')['set'].nunique().max() == 1
+    assert df.groupby('group')['stim'].nunique().max() == 1
+
+
+def test_select_sets_short_pool():
+    with pytest.raises(ValueError):
+        Emo_Select.select_sets(Emo_Select.get_pool(make_pool(n=8)), dict(CONFIG))
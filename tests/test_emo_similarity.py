@@ -0,0 +1,43 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Emo_Similarity
+
+
+def make_hashes(n=400, seed=0):
+    """Random hashes, with copies and near copies of some of them."""
+    rng = np.random.default_rng(seed)
+    bases = rng.integers(0, 2 ** 63, size=n // 2, dtype=np.uint64) * np.uint64(2) + \
+        rng.integers(0, 2, size=n // 2, dtype=np.uint64)
+    near = bases[rng.integers(0, len(bases), size=n - len(bases))].copy()
+    for k, value in enumerate(near):
+        for bit in rng.choice(64, size=rng.integers(0, 14), replace=False):
+            value ^= np.uint64(1) << np.uint64(bit)
+        near[k] = value
+    return np.concatenate([bases, near])
+
+
+def brute_force(hashes, radius):
+    pairs = []
+    for i in range(len(hashes)):
+        for j in range(i + 1, len(hashes)):
+            distance = bin(int(hashes[i]) ^ int(hashes[j])).count('1')
+            if distance <= radius:
+                pairs.append((i, j, distance))
+    return pairs
+
+
+def test_near_duplicates_match_brute_force():
+    hashes = make_hashes()
+    for radius in [0, 3, 4, 6, 9, 12]:
+        i, j, distance = Emo_Similarity.find_near_duplicates(hashes, radius)
+        assert list(zip(i.tolist(), j.tolist(), distance.tolist())) == brute_force(hashes, radius)
+
+
+def test_near_duplicates_few_hashes():
+    for hashes in [[], [5], [5, 5]]:
+        i, j, distance = Emo_Similarity.find_near_duplicates(np.array(hashes, dtype=np.uint64), 6)
+        assert list(zip(i.tolist(), j.tolist(), distance.tolist())) == \
+            brute_force(np.array(hashes, dtype=np.uint64), 6)
@@ -0,0 +1,57 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Emo_Stats
+
+
+def make_frame(n=12, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'ID': np.repeat(np.arange(n), 2), 'inst': np.tile([1, 2], n),
+                         'score': rng.normal(size=2 * n), 'constant': 0.5})
+
+
+def test_resample_constant_depvar():
+    df = Emo_Stats.resample_rm(make_frame(), ['score', 'constant'], 'ID', 'inst', n_resamples=2000)
+    score, constant = df.iloc[0], df.iloc[1]
+    assert np.isnan(constant['F']) and np.isnan(constant['p'])
+    for col in ['p_perm', 'eta_p2_low', 'eta_p2_high', 'diff_low', 'diff_high']:
+        assert np.isnan(constant[col])
+    assert np.isfinite(score[['F', 'p', 'p_perm', 'eta_p2_low', 'eta_p2_high', 'diff_low', 'diff_high']]
+                       .astype(float)).all()
+    assert 0 < score['p_perm'] <= 1
+
+
+def make_factorial(n=10, seed=1):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame([(subject, a, b) for subject in range(n) for a in 'xyz' for b in 'uv'],
+                      columns=['ID', 'a', 'b'])
+    df['y1'] = rng.normal(size=len(df)) + (df['a'] == 'z') * 0.8
+    df['y2'] = rng.normal(size=len(df)) + df['ID'] * 0.3 + (df['b'] == 'v') * 0.5
+    return df
+
+
+def test_anova_matches_statsmodels():
+    from statsmodels.stats.anova import AnovaRM
+    df = make_factorial()
+    df_anova = Emo_Stats.anova_rm(df, ['y1', 'y2'], 'ID', ['a', 'b'])
+    for depvar in ['y1', 'y2']:
+        table = AnovaRM(df, depvar, 'ID', within=['a', 'b']).fit().anova_table
+        ours = df_anova.loc[df_anova['depvar'] == depvar].set_index('effect')
+        for effect, row in table.iterrows():
+            assert np.isclose(ours.loc[effect, 'F'], row['F Value'])
+            assert ours.loc[effect, 'num_df'] == row['Num DF']
+            assert ours.loc[effect, 'den_df'] == row['Den DF']
+            assert np.isclose(ours.loc[effect, 'p'], row['Pr > F'])
+
+
+def test_identical_sessions_have_no_f():
+    df = make_frame()
+    df['same'] = np.repeat(np.random.default_rng(2).normal(size=12) * 0.37 + 0.1, 2)
+    df_anova = Emo_Stats.anova_rm(df, ['score', 'same'], 'ID', ['inst'])
+    df_resample = Emo_Stats.resample_rm(df, ['score', 'same'], 'ID', 'inst', n_resamples=1000)
+    assert np.isnan(df_anova['F'].iloc[1]) and np.isnan(df_resample['F'].iloc[1])
+    assert np.isnan(df_resample['p_perm'].iloc[1])
+    assert np.allclose(df_anova['F'].iloc[:1], df_resample['F'].iloc[:1])